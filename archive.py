@@ -0,0 +1,228 @@
+import collections
+import json
+import pathlib
+import threading
+
+import checkpoint
+from genome import NetworkCache, read_genome
+
+#the genomes and compiled networks of a simulation, opened lazily. each genome is its own
+#file, Genomes/<name>.json, so the manifest only has to name the directories, not list every
+#genome: loading a simulation costs the same however many genomes it holds. a genome is only
+#read, and its network only opened, the first time it's used. the most recently used of each
+#are kept open, and the rest closed again, so memory is bounded by what is in use rather than
+#by the size of the archive. safe to use from any thread
+class Archive:
+    #path: the simulation directory
+    #genomes_directory, networks_directory: the directories inside it holding the genomes and
+    #the compiled network cache (see genome.NetworkCache)
+    #max_genomes, max_networks: the most genomes and networks to keep open at once
+    def __init__(self, path, genomes_directory="Genomes", networks_directory="Networks",
+        max_genomes=256, max_networks=4):
+        self.genomes_directory = pathlib.Path(path) / genomes_directory
+        self.networks_directory = pathlib.Path(path) / networks_directory
+        self.max_genomes = max_genomes
+        self.max_networks = max_networks
+
+        #the open genomes and networks by name, least recently used first
+        self.genomes = collections.OrderedDict()
+        self.networks = collections.OrderedDict()
+        #only created when the first network is opened, so simulations without networks
+        #don't get a Networks directory
+        self.cache = None
+        self.lock = threading.Lock()
+        #a lock per network being compiled, so threads opening the same network wait for one
+        #compile rather than each doing their own
+        self.compiling = {}
+
+    #returns the path of a genome's file
+    def genome_path(self, name):
+        if "/" in name or "\\" in name or name.startswith("."):
+            raise ValueError(f"'{name}' is not a valid genome name")
+        return self.genomes_directory / (name + ".json")
+
+    #returns the names of every genome, sorted. this lists the whole directory, so unlike
+    #everything else here, it takes longer the more genomes there are
+    def names(self):
+        if not self.genomes_directory.exists():
+            return []
+        return sorted(path.stem for path in self.genomes_directory.glob("*.json"))
+
+    #returns true if there is a genome called name
+    def __contains__(self, name):
+        return self.genome_path(name).exists()
+
+    #returns the genome called name, reading it if it isn't already open
+    #raises KeyError if there is no such genome
+    def genome(self, name):
+        with self.lock:
+            genome = self.genomes.get(name)
+            if genome is not None:
+                self.genomes.move_to_end(name)
+                return genome
+
+        path = self.genome_path(name)
+        if not path.exists():
+            raise KeyError(f"no genome called '{name}'")
+        genome = read_genome(path)
+
+        with self.lock:
+            self._insert(self.genomes, name, genome, self.max_genomes)
+        return genome
+
+    #returns the network the genome called name describes, opening it if it isn't already
+    #open. the network is compiled the first time, and memory mapped from the network cache
+    #after that (see NetworkCache.compile). the same network object is returned until it's
+    #evicted, so changes made by stepping it last only as long as it stays open
+    #raises KeyError if there is no such genome
+    def network(self, name):
+        with self.lock:
+            network = self.networks.get(name)
+            if network is not None:
+                self.networks.move_to_end(name)
+                return network
+
+            if self.cache is None:
+                self.cache = NetworkCache(self.networks_directory)
+            compile_lock = self.compiling.setdefault(name, threading.Lock())
+
+        with compile_lock:
+            with self.lock:
+                #another thread opened it while this one waited. share theirs
+                network = self.networks.get(name)
+                if network is not None:
+                    self.networks.move_to_end(name)
+                    return network
+
+            network = None
+            try:
+                network = self.cache.compile(self.genome(name))
+            finally:
+                #opened and no longer compiling in one step, so no thread can miss both
+                with self.lock:
+                    if network is not None:
+                        self._insert(self.networks, name, network, self.max_networks)
+                    if self.compiling.get(name) is compile_lock:
+                        del self.compiling[name]
+        return network
+
+    #adds a genome called name, replacing any genome of that name. the file is written
+    #atomically. a replaced genome's open network is closed, so its new network is used from
+    #then on
+    def add_genome(self, name, genome):
+        path = self.genome_path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint.write_json(str(path.parent), path.name, genome)
+
+        with self.lock:
+            self.networks.pop(name, None)
+            self._insert(self.genomes, name, genome, self.max_genomes)
+
+    #closes every open genome and network
+    def clear(self):
+        with self.lock:
+            self.genomes.clear()
+            self.networks.clear()
+
+    #adds an entry to an lru dict, evicting the least recently used entries past max_size.
+    #call while holding the lock
+    @staticmethod
+    def _insert(entries, name, value, max_size):
+        entries[name] = value
+        entries.move_to_end(name)
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+if __name__ == "__main__":
+    import tempfile
+    import threading
+    import time
+
+    import numpy as np
+
+    from simulation import Simulation
+
+    #test settings
+    archive_sizes = (10, 1000, 10_000)
+    n_used = 3
+
+    class ArchiveSim(Simulation):
+        @staticmethod
+        def configure_new_sim(path):
+            with open(path + "/manifest.json", "w", encoding="utf-8") as f:
+                json.dump({"Genomes Directory" : "Genomes", "Networks Directory" : "Networks"},
+                    f)
+
+    def example_genome(seed):
+        return {
+            "Neurons" : [{"Count" : 1000}],
+            "Connections" : [
+                {"From" : 0, "To" : 0, "Fan out" : 10, "Weight low" : 0, "Weight high" : 6}
+            ],
+            "Seed" : seed
+        }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for n_genomes in archive_sizes:
+            path = f"{directory}/{n_genomes}"
+            ArchiveSim.create_new_sim(path)
+            genomes = pathlib.Path(path + "/Genomes")
+            genomes.mkdir()
+            for i in range(n_genomes):
+                with open(genomes / f"genome{i}.json", "w", encoding="utf-8") as f:
+                    json.dump(example_genome(i), f)
+
+            #loading only reads the manifest, and running a few networks only opens those
+            start = time.perf_counter()
+            sim = ArchiveSim.load_sim(path)
+            load_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(n_used):
+                sim.archive.network(f"genome{i}").step(np.full(1000, 4.0))
+            use_time = time.perf_counter() - start
+
+            print(f"{n_genomes} genomes: loaded in {load_time*1e3:.2f}ms, "
+                f"{n_used} networks opened in {use_time*1e3:.1f}ms")
+
+        #the same network is returned while it's open, and closed once evicted
+        archive = sim.archive
+        archive.max_networks = 2
+        first = archive.network("genome0")
+        assert archive.network("genome0") is first
+        archive.network("genome5")
+        archive.network("genome6")
+        assert list(archive.networks) == ["genome5", "genome6"]
+        assert archive.network("genome0") is not first
+
+        #replacing a genome closes its network
+        archive.add_genome("genome0", example_genome(12345))
+        assert "genome0" not in archive.networks
+        assert archive.genome("genome0")["Seed"] == 12345
+        assert "genome0" in archive and not "missing" in archive
+
+        try:
+            archive.genome("missing")
+            assert False, "opening a missing genome should fail"
+        except KeyError as e:
+            print(f"expected error: {e}")
+
+        #threads opening the same uncompiled network at once must compile it once and all
+        #share it
+        archive.add_genome("shared", dict(example_genome(777), Neurons=[{"Count" : 100_000}]))
+        opened, errors = [], []
+        def open_network():
+            try:
+                opened.append(archive.network("shared"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_network) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        assert len(opened) == 4 and all(network is opened[0] for network in opened)
+        assert not archive.compiling
+        print(f"{len(threads)} threads opened one network at once")
@@ -0,0 +1,280 @@
+import numpy as np
+
+from network import Network
+from population import NeuronPopulation
+from synapse import DelayQueue, Synapses
+
+#many independent networks of the same size stepped side by side, i.e. for parameter sweeps
+#or evaluating a generation of genomes. the trials are stacked along an extra axis, so every
+#state array has shape (trials, neurons), and the synapses of all of the trials are joined
+#into one block diagonal set. a tick of every trial is then a single vectorised step rather
+#than a python call per trial, and the trials never interact
+#results match stepping each network on its own exactly
+class NetworkBatch:
+    #networks: list of Networks with the same number of neurons, state type and tick count,
+    #and no plasticity. their state is copied, so the originals are left untouched. every
+    #trial is stepped densely, even if its network is event driven
+    def __init__(self, networks):
+        if not networks:
+            raise ValueError("a batch needs at least one network")
+
+        self.n_trials = len(networks)
+        self.size = len(networks[0])
+        dtype = networks[0].population.dtype
+        for network in networks:
+            if len(network) != self.size or network.population.dtype != dtype:
+                raise ValueError("every network in a batch must have the same size and dtype")
+            if network.tick != networks[0].tick:
+                raise ValueError("every network in a batch must be on the same tick")
+            if network.plasticity is not None:
+                raise ValueError("networks in a batch can't have plasticity")
+            network.sync()
+
+        #the flat index of every trial's neurons must still fit in the synapse target type
+        if self.n_trials * self.size > np.iinfo(np.int32).max:
+            raise ValueError("too many neurons in the batch, use fewer or smaller trials")
+
+        #stack the state of every trial. the population steps the flattened views, which
+        #share memory with the (trials, neurons) arrays
+        state = {
+            name : np.stack([getattr(network.population, name) for network in networks])
+            for name in NeuronPopulation.state_names
+        }
+        params, param_index = self._join_parameters([n.population for n in networks])
+        self.population = NeuronPopulation(self.n_trials * self.size, params, param_index,
+            dtype, state={name : values.reshape(-1) for name, values in state.items()})
+        self.state = state
+
+        self.synapses = self._join_synapses([network.synapses for network in networks])
+
+        #join the input in flight of trials with delays. each trial's buckets are indexed by
+        #the shared tick, so they line up once they're padded to the same number
+        self.queue = None
+        if self.synapses.delays is not None:
+            pending = np.zeros((self.synapses.max_delay, self.n_trials, self.size))
+            for i, network in enumerate(networks):
+                if network.queue is not None:
+                    pending[:, i] = self._rebucket(network.queue.pending, network.tick,
+                        self.synapses.max_delay)
+            self.queue = DelayQueue(self.synapses, pending.reshape(len(pending), -1))
+
+        self.spikes = np.stack([network.population.output() for network in networks])
+        self.tick = networks[0].tick
+
+    #builds a batch of n_trials random networks, one per seed. see Network.random
+    #seeds: the seed of each trial. defaults to 0, 1, 2, ...
+    @classmethod
+    def random(cls, n_trials, size, fan_out, weight_low, weight_high, seeds=None):
+        seeds = range(n_trials) if seeds is None else seeds
+        return cls([
+            Network.random(size, fan_out, weight_low, weight_high, seed) for seed in seeds
+        ])
+
+    #returns the settings and param_index of a population made of every trial's neurons in
+    #turn. trials that all use the same settings share them, otherwise each trial's settings
+    #table is appended and its param_index offset to match
+    def _join_parameters(self, populations):
+        first = populations[0].params
+        if all(p.param_index is None and p.params is first for p in populations):
+            return first, None
+
+        params = []
+        param_index = np.empty(self.n_trials * self.size, dtype=np.int64)
+        for i, population in enumerate(populations):
+            trial = slice(i * self.size, (i + 1) * self.size)
+            if population.param_index is None:
+                param_index[trial] = len(params)
+                params.append(population.params)
+            else:
+                param_index[trial] = population.param_index + len(params)
+                params.extend(population.params)
+
+        return params, param_index
+
+    #returns the synapses of every trial joined into one set, with trial i's neurons
+    #renumbered to i * size onwards. each trial's synapses keep their order, so the swi
+    #computed for each trial is identical to computing it on its own
+    def _join_synapses(self, synapses):
+        offsets = np.cumsum([0] + [len(s) for s in synapses])
+
+        indptr = np.concatenate([s.indptr[:-1] + offset for s, offset in zip(synapses, offsets)]
+            + [offsets[-1:]])
+        targets = np.concatenate([s.targets + i * self.size for i, s in enumerate(synapses)])
+        weights = np.concatenate([s.weights for s in synapses])
+
+        #synapses without delays have a delay of 1
+        delays = None
+        if any(s.delays is not None for s in synapses):
+            delays = np.concatenate([
+                np.ones(len(s), dtype=np.int64) if s.delays is None else s.delays
+                for s in synapses
+            ])
+
+        n = self.n_trials * self.size
+        return Synapses(n, n, indptr, targets, weights, delays=delays)
+
+    #returns a ring buffer of pending input moved to n_buckets buckets, keeping the input due
+    #on each tick from tick onwards
+    @staticmethod
+    def _rebucket(pending, tick, n_buckets):
+        rebucketed = np.zeros((n_buckets,) + pending.shape[1:])
+        for k in range(len(pending)):
+            rebucketed[(tick + k) % n_buckets] = pending[(tick + k) % len(pending)]
+        return rebucketed
+
+    #performs one timestep of every trial
+    #external: optional external input added to every neuron's swi. an array of shape
+    #(trials, neurons) gives each trial its own input, and anything that broadcasts to that
+    #shape also works, i.e. a (trials, 1) array for one value per trial
+    #returns the boolean spike array of shape (trials, neurons)
+    def step(self, external=None):
+        if self.queue is None:
+            swi = self.synapses.compute_swi(self.spikes.reshape(-1))
+        else:
+            self.queue.push(self.tick, np.flatnonzero(self.spikes))
+            swi = self.queue.pop(self.tick)
+        if external is not None:
+            swi += np.broadcast_to(external, self.spikes.shape).reshape(-1)
+
+        self.spikes = self.population.step(swi).reshape(self.spikes.shape)
+        self.tick += 1
+        return self.spikes
+
+    #runs n_ticks ticks of every trial
+    #input_fn: optional function (tick, trials) returning the external input of the given
+    #trials on the given tick, as for step. trials is an array of trial indices, so a seeded
+    #input can be drawn per trial, i.e. by an input source (see inputs.InputSource.for_batch)
+    #returns the number of spikes of each trial on each tick, with shape (ticks, trials)
+    def run(self, n_ticks, input_fn=None):
+        trials = np.arange(self.n_trials)
+        counts = np.zeros((n_ticks, self.n_trials), dtype=np.int64)
+
+        for i in range(n_ticks):
+            external = None if input_fn is None else input_fn(self.tick, trials)
+            counts[i] = np.count_nonzero(self.step(external), axis=1)
+
+        return counts
+
+    #returns a copy of one trial as a standalone Network, i.e. to keep the best of a
+    #generation
+    def network(self, trial):
+        arrays = {name : values[trial].copy() for name, values in self.state.items()}
+
+        #cut the trial's synapses back out of the joined set
+        lo, hi = trial * self.size, (trial + 1) * self.size
+        indptr = self.synapses.indptr[lo:hi + 1]
+        arrays["indptr"] = indptr - indptr[0]
+        arrays["targets"] = self.synapses.targets[indptr[0]:indptr[-1]] - lo
+        arrays["weights"] = self.synapses.weights[indptr[0]:indptr[-1]].copy()
+        arrays["spikes"] = np.flatnonzero(self.spikes[trial])
+        arrays["tick"] = np.array(self.tick)
+
+        if self.queue is not None:
+            arrays["delays"] = self.synapses.delays[indptr[0]:indptr[-1]]
+            arrays["pending"] = self.queue.pending[:, lo:hi].copy()
+
+        params = self.population.params
+        if self.population.param_index is not None:
+            #only keep the settings this trial uses
+            used, arrays["param_index"] = np.unique(self.population.param_index[lo:hi],
+                return_inverse=True)
+            params = [params[i] for i in used]
+
+        return Network.from_arrays(arrays, params)
+
+    #returns the number of trials
+    def __len__(self):
+        return self.n_trials
+
+if __name__ == "__main__":
+    import threading
+    import time
+
+    from inputs import UniformInput
+    from neuron import NeuronParameters
+
+    #test settings
+    n_trials = 100
+    n_neurons = 200
+    n_ticks = 500
+
+    #seeded noisy drive, with each trial getting its own input
+    example_input = UniformInput(4).for_batch(n_neurons)
+
+    #the reference: every trial stepped on its own, with some trials using different settings
+    fast = NeuronParameters(excitation_decay=0.5, spike_threshold=12)
+    def make_networks():
+        networks = [Network.random(n_neurons, 10, 0, 6, seed) for seed in range(n_trials)]
+        for network in networks[::3]:
+            network.population = NeuronPopulation(n_neurons, fast)
+        return networks
+
+    networks = make_networks()
+    batch = NetworkBatch(make_networks())
+
+    start = time.perf_counter()
+    reference_counts = np.zeros((n_ticks, n_trials), dtype=np.int64)
+    for t in range(n_ticks):
+        for i, network in enumerate(networks):
+            reference_counts[t, i] = len(network.step(example_input(t, [i])[0]))
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_counts = batch.run(n_ticks, example_input)
+    batch_time = time.perf_counter() - start
+
+    #the results must match exactly
+    assert np.array_equal(reference_counts, batch_counts)
+
+    #trials taken out of the batch must carry on exactly as the originals, settings included
+    for i in (0, 1, n_trials - 1):
+        extracted = batch.network(i)
+        for name in NeuronPopulation.state_names:
+            assert np.array_equal(getattr(networks[i].population, name),
+                getattr(extracted.population, name))
+
+        for t in range(n_ticks, n_ticks + 100):
+            external = example_input(t, [i])[0]
+            assert np.array_equal(networks[i].step(external), extracted.step(external))
+
+    print(f"batch of {n_trials} trials matches separate networks over {n_ticks} ticks")
+
+    #trials with different maximum delays, and none, batched part way through a run so
+    #input is already in flight
+    delayed = [Network.random(n_neurons, 10, 0, 6, seed, max_delay=d) for seed, d in
+        enumerate((1, 3, 7))] + [Network.random(n_neurons, 10, 0, 6, seed=3)]
+    for t in range(50):
+        for i, network in enumerate(delayed):
+            network.step(example_input(t, [i])[0])
+
+    delayed_batch = NetworkBatch([network.astype(np.float64) for network in delayed])
+    for t in range(50, 50 + n_ticks):
+        spikes = delayed_batch.step(example_input(t, range(len(delayed))))
+        for i, network in enumerate(delayed):
+            assert np.array_equal(np.flatnonzero(spikes[i]),
+                network.step(example_input(t, [i])[0])), f"trial {i}, tick {t}"
+
+    extracted = delayed_batch.network(2)
+    for t in range(50 + n_ticks, 150 + n_ticks):
+        external = example_input(t, [2])[0]
+        assert np.array_equal(delayed[2].step(external), extracted.step(external))
+
+    print("batched trials with delays match separate networks")
+
+    #the same networks in one thread each, as running a Simulation per trial would
+    networks = make_networks()
+    def run_trial(i, network):
+        for t in range(n_ticks):
+            network.step(example_input(t, [i])[0])
+
+    threads = [threading.Thread(target=run_trial, args=(i, n)) for i, n in enumerate(networks)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    thread_time = time.perf_counter() - start
+
+    trial_ticks = n_trials * n_ticks
+    print(f"separate: {trial_ticks/reference_time:.0f} trial ticks/sec, threads: "
+        f"{trial_ticks/thread_time:.0f}, batch: {trial_ticks/batch_time:.0f}")
@@ -0,0 +1,288 @@
+import argparse
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from network import Network
+from neuron import Neuron
+from population import NeuronPopulation
+from simulation import Simulation
+from synapse import Synapses
+
+#the minimum wall time to spend timing each benchmark, in seconds
+min_duration = 1
+
+#calls fn repeatedly for at least min_duration seconds
+#returns the number of calls per second
+def calls_per_sec(fn):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_duration:
+            return calls / elapsed
+
+#returns the number of bytes allocated by fn while building its result, and the result
+def allocated_bytes(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return allocated, result
+
+#measures memory and throughput of n_neurons individual Neuron objects
+def bench_neurons(n_neurons):
+    #build the neurons and step them once, so that their state holds floats as it would
+    #in a running network
+    def build():
+        neurons = [Neuron() for _ in range(n_neurons)]
+        for n in neurons:
+            n.step(0.5)
+        return neurons
+
+    allocated, neurons = allocated_bytes(build)
+
+    def tick():
+        for n in neurons:
+            n.step(0.5)
+
+    return {
+        "neurons" : n_neurons,
+        "bytes_per_neuron" : allocated / n_neurons,
+        "neuron_steps_per_sec" : calls_per_sec(tick) * n_neurons
+    }
+
+#measures memory and throughput of a NeuronPopulation of n_neurons
+#firing_rate: the fraction of neurons driven over the spike threshold each tick
+def bench_population(n_neurons, firing_rate=0):
+    allocated, population = allocated_bytes(lambda: NeuronPopulation(n_neurons))
+    rng = np.random.default_rng(0)
+    swi = np.where(rng.random(n_neurons) < firing_rate, 2 * Neuron.spike_threshold, 0.5)
+
+    return {
+        "neurons" : n_neurons,
+        "firing_rate" : firing_rate,
+        "bytes_per_neuron" : allocated / n_neurons,
+        "neuron_steps_per_sec" : calls_per_sec(lambda: population.step(swi)) * n_neurons
+    }
+
+#measures how fast the swi of n_neurons neurons with fan_out synapses each is computed,
+#with firing_rate of them spiking
+def bench_synapses(n_neurons, fan_out, firing_rate):
+    synapses = Synapses.random(n_neurons, n_neurons, fan_out, 0, 1, seed=0)
+    spikes = np.flatnonzero(np.random.default_rng(1).random(n_neurons) < firing_rate)
+
+    return {
+        "neurons" : n_neurons,
+        "fan_out" : fan_out,
+        "firing_rate" : firing_rate,
+        "ticks_per_sec" : calls_per_sec(lambda: synapses.compute_swi(spikes))
+    }
+
+#a simulation holding a network, for timing saving and loading
+class NetworkSim(Simulation):
+    def __init__(self, path, **kwargs):
+        Simulation.__init__(self, path, **kwargs)
+        self.network = Network.from_arrays(self.state) if self.state else None
+
+    def sync_state(self):
+        self.state = self.network.arrays()
+
+#measures saving and loading a simulation holding a network of n_neurons with fan_out
+#synapses each. the first save writes every array, later saves only the changed state
+#returns the time of each in milliseconds
+def bench_save_load(n_neurons, fan_out):
+    with tempfile.TemporaryDirectory() as path:
+        sim = NetworkSim(path)
+        sim.network = Network.random(n_neurons, fan_out, 0, 6, seed=0)
+
+        start = time.perf_counter()
+        sim.save()
+        full_save = time.perf_counter() - start
+
+        sim.network.step(4 * np.random.default_rng(1).random(n_neurons))
+        start = time.perf_counter()
+        sim.save()
+        incremental_save = time.perf_counter() - start
+
+        #loading is timed until the network has stepped once, so that lazily loaded arrays
+        #are counted
+        start = time.perf_counter()
+        loaded = NetworkSim.load_sim(path)
+        loaded.network.step()
+        load = time.perf_counter() - start
+        del loaded
+
+    return {
+        "neurons" : n_neurons,
+        "synapses" : n_neurons * fan_out,
+        "full_save_ms" : full_save * 1e3,
+        "incremental_save_ms" : incremental_save * 1e3,
+        "load_ms" : load * 1e3
+    }
+
+#a simulation whose ticks step a small population, for timing lifecycle control
+class LatencySim(Simulation):
+    def __init__(self):
+        Simulation.__init__(self, None)
+        self.population = NeuronPopulation(1000)
+
+    def sim_thread_target(self):
+        self.step_loop(lambda: self.population.step(0.5))
+
+#measures how long each lifecycle control takes to take effect, over n_rounds rounds of
+#start, pause, unpause and stop. start is timed until the simulation thread is ticking
+#returns the median and worst latency of each control in milliseconds
+def bench_lifecycle(n_rounds=200):
+    sim = LatencySim()
+    latencies = {"start" : [], "pause" : [], "unpause" : [], "stop" : []}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        fn()
+        latencies[name].append((time.perf_counter() - start) * 1e3)
+
+    def start():
+        sim.start()
+        with sim.sim_condition:
+            sim.sim_condition.wait_for(lambda: sim.sim_active)
+
+    for _ in range(n_rounds):
+        timed("start", start)
+        timed("pause", sim.pause)
+        timed("unpause", sim.unpause)
+        timed("stop", sim.stop)
+
+    return {
+        name : {"median_ms" : float(np.median(values)), "max_ms" : float(np.max(values))}
+        for name, values in latencies.items()
+    }
+
+#runs every benchmark
+#quick: use smaller sizes and shorter timings, i.e. for a fast check while working
+#returns the results as a dict of named metrics. each metric has its value, its unit, and
+#whether higher values are better
+def run_suite(quick=False):
+    global min_duration
+    if quick:
+        min_duration = 0.2
+    sizes = [10_000, 100_000] if quick else [10_000, 100_000, 1_000_000]
+    #the workload is part of every metric's name, so quick and full runs never share a name
+    #for different work, and can be compared where they do the same
+    fan_out = 10 if quick else 100
+
+    metrics = {}
+    def add(name, value, unit, higher_is_better):
+        metrics[name] = {"value" : value, "unit" : unit, "higher_is_better" : higher_is_better}
+
+    for r in [bench_neurons(n) for n in sizes]:
+        add(f"neuron/{r['neurons']}/steps", r["neuron_steps_per_sec"], "neuron steps/sec", True)
+        add(f"neuron/{r['neurons']}/memory", r["bytes_per_neuron"], "bytes/neuron", False)
+
+    for n in sizes:
+        for rate in (0, 0.01, 0.1):
+            r = bench_population(n, rate)
+            add(f"population/{n}/{rate}/steps", r["neuron_steps_per_sec"], "neuron steps/sec",
+                True)
+        add(f"population/{n}/memory", r["bytes_per_neuron"], "bytes/neuron", False)
+
+    for n in sizes:
+        for rate in (0.01, 0.1):
+            r = bench_synapses(n, fan_out, rate)
+            add(f"synapses/{n}/{fan_out}/{rate}/ticks", r["ticks_per_sec"], "ticks/sec", True)
+
+    r = bench_save_load(sizes[-1], fan_out)
+    for name in ("full_save_ms", "incremental_save_ms", "load_ms"):
+        add(f"checkpoint/{r['neurons']}/{fan_out}/{name[:-3]}", r[name], "ms", False)
+
+    for name, latency in bench_lifecycle(50 if quick else 200).items():
+        add(f"lifecycle/{name}", latency["median_ms"], "ms", False)
+
+    return metrics
+
+#returns the names of the metrics that are more than threshold (as a fraction) worse than
+#in baseline. metrics missing from either are skipped
+def regressions(metrics, baseline, threshold):
+    regressed = []
+    for name, metric in metrics.items():
+        if not name in baseline:
+            continue
+
+        old, new = baseline[name]["value"], metric["value"]
+        if metric["higher_is_better"]:
+            worse = new < old * (1 - threshold)
+        else:
+            worse = new > old * (1 + threshold)
+
+        if worse:
+            regressed.append(name)
+
+    return regressed
+
+#returns the current git commit, if there is one
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=pathlib.Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the simulation's hot paths")
+    parser.add_argument("--output", help="file to write the results to as json")
+    parser.add_argument("--baseline", help="results json of an earlier run to compare to")
+    parser.add_argument("--threshold", type=float, default=0.1,
+        help="fraction a metric may be worse than the baseline before failing (default 0.1)")
+    parser.add_argument("--quick", action="store_true", help="run smaller, shorter benchmarks")
+    args = parser.parse_args()
+
+    metrics = run_suite(args.quick)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["Metrics"]
+
+    for name, metric in metrics.items():
+        change = ""
+        if name in baseline:
+            change = f" ({metric['value'] / baseline[name]['value'] - 1:+.1%})"
+        print(f"{name:>40}: {metric['value']:16,.3f} {metric['unit']}{change}")
+
+    if args.output:
+        results = {
+            "Commit" : current_commit(),
+            "Python" : platform.python_version(),
+            "Numpy" : np.__version__,
+            "Platform" : platform.platform(),
+            "Quick" : args.quick,
+            "Metrics" : metrics
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    #lifecycle controls should take effect in well under a millisecond, whatever the baseline
+    failed = [name for name in metrics if name.startswith("lifecycle/")
+        and metrics[name]["value"] >= 1]
+    if failed:
+        print(f"slower than 1ms: {', '.join(failed)}")
+
+    regressed = regressions(metrics, baseline, args.threshold)
+    if regressed:
+        print(f"worse than the baseline by over {args.threshold:.0%}: {', '.join(regressed)}")
+
+    if failed or regressed:
+        sys.exit(1)
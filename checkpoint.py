@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import weakref
+
+import numpy as np
+
+#the directory inside a simulation that holds the checkpointed arrays. each checkpoint is
+#written to its own numbered generation directory inside it
+state_directory = "State"
+
+#writes path/name atomically: the data is written to a temporary file, flushed to disk, and
+#then renamed over the original, so a crash leaves either the old or the new file
+def write_json(path, name, data):
+    tmp_path = path + "/" + name + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path + "/" + name)
+
+#the hashes of read-only arrays by id, each with a weak reference to its array so that a
+#reused id is never mistaken for it. read-only arrays can't change, so they are only hashed
+#once however many checkpoints they are in
+_read_only_hashes = {}
+
+#returns a hash of an array's contents, type and shape
+def array_hash(values):
+    values = np.asanyarray(values)
+    if values.flags.writeable:
+        return _hash(values)
+
+    key = id(values)
+    cached = _read_only_hashes.get(key)
+    if cached is not None and cached[0]() is values:
+        return cached[1]
+
+    values_hash = _hash(values)
+    _read_only_hashes[key] = (weakref.ref(values,
+        lambda ref: _read_only_hashes.pop(key, None)), values_hash)
+    return values_hash
+
+#hashes an array's contents, type and shape
+def _hash(values):
+    values = np.ascontiguousarray(values)
+
+    digest = hashlib.blake2b(f"{values.dtype.str}{values.shape}".encode())
+    digest.update(values.data)
+    return digest.hexdigest()
+
+#writes a dict of numpy arrays to a new checkpoint generation inside the simulation at path.
+#arrays that are unchanged since the previous checkpoint aren't written again; the new
+#record points to the existing file instead
+#previous: the record of the previous checkpoint, if there is one
+#returns the checkpoint record to store in the manifest. the checkpoint isn't used until the
+#manifest holding the record has been written (see Simulation.save), so a crash at any point
+#leaves the previous checkpoint intact
+def write(path, arrays, generation, previous=None):
+    directory = f"{state_directory}/{generation}"
+    tmp_directory = pathlib.Path(path + "/" + directory + ".tmp")
+    previous_arrays = {} if previous is None else previous["Arrays"]
+
+    #clear out anything left over by a crash during an earlier save. that includes a whole
+    #generation directory, if the crash came after it was renamed into place but before the
+    #manifest pointing to it was written: no record uses it, and it would block the rename
+    if str(generation) in _used_generations(previous):
+        raise ValueError(f"generation {generation} is still used by the previous checkpoint")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    shutil.rmtree(path + "/" + directory, ignore_errors=True)
+    tmp_directory.mkdir(parents=True)
+
+    record = {"Generation" : generation, "Arrays" : {}}
+    for name, values in arrays.items():
+        values_hash = array_hash(values)
+
+        #reuse the previous file if the array hasn't changed
+        entry = previous_arrays.get(name)
+        if entry is not None and entry["Hash"] == values_hash:
+            record["Arrays"][name] = entry
+            continue
+
+        with open(tmp_directory / (name + ".npy"), "wb") as f:
+            np.save(f, np.asarray(values), allow_pickle=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+        record["Arrays"][name] = {"File" : f"{directory}/{name}.npy", "Hash" : values_hash}
+
+    os.replace(tmp_directory, path + "/" + directory)
+    return record
+
+#opens the arrays of a checkpoint record written by write
+#mmap: if true, the arrays are memory mapped copy-on-write. loading is then near instant
+#whatever the size, pages are only read from disk when used, and changes made to the arrays
+#stay in memory instead of being written back to the checkpoint
+#returns a dict of the arrays, which is empty if there is no checkpoint
+def read(path, record, mmap=True):
+    if record is None:
+        return {}
+
+    return {
+        name : np.load(path + "/" + entry["File"], mmap_mode="c" if mmap else None,
+            allow_pickle=False)
+        for name, entry in record["Arrays"].items()
+    }
+
+#returns the names of the generation directories a checkpoint record's files are in
+def _used_generations(record):
+    if record is None:
+        return set()
+    return {pathlib.PurePosixPath(entry["File"]).parts[1] for entry in record["Arrays"].values()}
+
+#deletes every checkpoint generation inside the simulation at path that isn't used by record.
+#a generation stays as long as any of its files is still used
+def prune(path, record):
+    used = _used_generations(record)
+
+    directory = pathlib.Path(path + "/" + state_directory)
+    if not directory.exists():
+        return
+
+    for generation in directory.iterdir():
+        if not generation.name in used:
+            shutil.rmtree(generation, ignore_errors=True)
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import socket
+import threading
+
+#serves control of a simulation over a local socket, so a simulation can be run headless
+#and driven by any client (i.e. ControlClient, or the Tk window in interface.py). the
+#protocol is one json object per line each way. every request has a "command" and gets one
+#response with "ok", plus "error" if it failed:
+#   create (path), load (path), unload, start, pause, stop, save: control the simulation
+#   status: returns whether a simulation is loaded and running, and its metrics
+#   subscribe (interval): streams a status every interval seconds until the client leaves
+#the server runs an asyncio loop on its own thread. commands that wait on the simulation
+#(i.e. pause, which waits for the simulation thread to go idle) run on worker threads, so
+#the server keeps answering status requests, and nothing it does ever waits inside a tick
+class ControlServer:
+    #sim_class: the Simulation class to create and load simulations with
+    #host, port: the address to listen on. port 0 picks a free port; see address
+    def __init__(self, sim_class, host="127.0.0.1", port=0):
+        self.sim_class = sim_class
+        self.sim = None
+        self.path = None
+
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(host, port, ready), daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    #the target function of the server thread
+    def _run(self, host, port, ready):
+        asyncio.set_event_loop(self.loop)
+
+        #commands that change the simulation are run one at a time
+        self.lock = asyncio.Lock()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._serve, host, port))
+        self.address = self.server.sockets[0].getsockname()[:2]
+        ready.set()
+
+        self.loop.run_forever()
+
+        #drop any clients still connected
+        self.server.close()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    #stops the server. any loaded simulation is stopped and saved first
+    def close(self):
+        if self.sim is not None:
+            self.command_unload({})
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    #answers the requests of one client until it disconnects
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    request = json.loads(line)
+                    if request.get("command") == "subscribe":
+                        await self._stream(writer, request.get("interval", 1))
+                        break
+                    response = await self._handle(request)
+                except Exception as e:
+                    response = {"ok" : False, "error" : f"{type(e).__name__}: {e}"}
+
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            #the client left, or the server is closing
+            pass
+        finally:
+            writer.close()
+
+    #returns the response to a request
+    async def _handle(self, request):
+        command = request.get("command")
+        if command == "status":
+            return self.command_status(request)
+
+        handler = getattr(self, f"command_{command}", None)
+        if handler is None:
+            raise ValueError(f"unknown command '{command}'")
+
+        async with self.lock:
+            return await self.loop.run_in_executor(None, handler, request)
+
+    #sends a status every interval seconds until the client disconnects
+    async def _stream(self, writer, interval):
+        while True:
+            writer.write(json.dumps(self.command_status({})).encode() + b"\n")
+            await writer.drain()
+            await asyncio.sleep(interval)
+
+    #returns the simulation, raising an error if none is loaded
+    def loaded_sim(self):
+        if self.sim is None:
+            raise RuntimeError("no simulation is loaded")
+        return self.sim
+
+    #command handlers. each takes the request and returns the response. apart from status,
+    #these run on a worker thread
+
+    def command_status(self, request):
+        sim = self.sim
+        if sim is None:
+            return {"ok" : True, "loaded" : False}
+
+        return {
+            "ok" : True,
+            "loaded" : True,
+            "path" : self.path,
+            "started" : sim.has_started(),
+            "paused" : sim.sim_paused,
+            "metrics" : sim.metrics()
+        }
+
+    def command_create(self, request):
+        self.sim_class.create_new_sim(request["path"])
+        return {"ok" : True}
+
+    def command_load(self, request):
+        if self.sim is not None:
+            raise RuntimeError(f"{self.path} is already loaded")
+
+        sim = self.sim_class.load_sim(request["path"])
+        if sim is None:
+            raise RuntimeError(f"{request['path']} is not a simulation")
+
+        self.sim, self.path = sim, request["path"]
+        return {"ok" : True}
+
+    #stops and saves the simulation, then forgets it
+    def command_unload(self, request):
+        sim = self.loaded_sim()
+        sim.stop()
+        sim.save()
+
+        self.sim, self.path = None, None
+        return {"ok" : True}
+
+    #starts the simulation thread, or unpauses it if it has already started
+    def command_start(self, request):
+        sim = self.loaded_sim()
+        if sim.has_started():
+            sim.unpause()
+        else:
+            sim.start()
+        return {"ok" : True}
+
+    def command_pause(self, request):
+        self.loaded_sim().pause()
+        return {"ok" : True}
+
+    def command_stop(self, request):
+        self.loaded_sim().stop()
+        return {"ok" : True}
+
+    #saves without stopping the simulation (see Simulation.save_async), and waits for the save
+    #to be written, so a failure is reported
+    def command_save(self, request):
+        sim = self.loaded_sim()
+        sim.save_async()
+        sim.wait_for_save()
+        return {"ok" : True}
+
+#a client of a ControlServer. each method sends one request and waits for its response
+class ControlClient:
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.socket = socket.create_connection(self.address)
+        self.file = self.socket.makefile("rwb")
+
+    #sends a request and returns the response
+    #raises RuntimeError with the server's message if the request failed
+    def request(self, command, **kwargs):
+        self.file.write(json.dumps(dict(kwargs, command=command)).encode() + b"\n")
+        self.file.flush()
+
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("the control server closed the connection")
+
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response
+
+    #yields a status from the server every interval seconds, over a separate connection so
+    #requests can still be made meanwhile
+    def subscribe(self, interval=1):
+        with socket.create_connection(self.address) as connection:
+            stream = connection.makefile("rwb")
+            stream.write(json.dumps({"command" : "subscribe", "interval" : interval}).encode()
+                + b"\n")
+            stream.flush()
+
+            for line in stream:
+                yield json.loads(line)
+
+    #closes the connection
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+if __name__ == "__main__":
+    import argparse
+    import importlib
+    import os
+    import tempfile
+    import time
+
+    from simulation import Simulation
+
+    parser = argparse.ArgumentParser(description="Serves control of simulations headlessly")
+    parser.add_argument("sim_class", nargs="?",
+        help="the simulation class to serve, as module:Class. runs a self test if not given")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.sim_class is not None:
+        module, name = args.sim_class.split(":")
+        server = ControlServer(getattr(importlib.import_module(module), name), args.host,
+            args.port)
+        print(f"serving {args.sim_class} on {server.address[0]}:{server.address[1]}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.close()
+    else:
+        #a simulation that counts ticks as fast as it can
+        class CountingSim(Simulation):
+            def __init__(self, path, **kwargs):
+                Simulation.__init__(self, path, **kwargs)
+                self.tick = self.manifest["Simulation update"]
+
+            @staticmethod
+            def configure_new_sim(path):
+                with open(path + "/manifest.json", "w", encoding="utf-8") as f:
+                    json.dump({"Simulation update" : 0}, f)
+
+            def sync_state(self):
+                self.manifest["Simulation update"] = self.tick
+
+            def metrics(self):
+                return dict(Simulation.metrics(self), tick=self.tick)
+
+            def do_tick(self):
+                self.tick += 1
+
+            def sim_thread_target(self):
+                self.step_loop(self.do_tick)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/CountingSim"
+            server = ControlServer(CountingSim)
+            client = ControlClient(*server.address)
+
+            client.request("create", path=path)
+            client.request("load", path=path)
+            client.request("start")
+            time.sleep(0.5)
+
+            #status requests are answered while the simulation runs, without slowing it
+            start = time.perf_counter()
+            statuses = [client.request("status") for _ in range(200)]
+            status_time = (time.perf_counter() - start) / len(statuses)
+            assert statuses[-1]["metrics"]["tick"] > statuses[0]["metrics"]["tick"]
+
+            #a second client streams metrics meanwhile
+            stream = ControlClient(*server.address).subscribe(0.1)
+            streamed = [next(stream)["metrics"]["tick"] for _ in range(3)]
+            assert streamed == sorted(streamed)
+
+            client.request("pause")
+            paused_tick = client.request("status")["metrics"]["tick"]
+            time.sleep(0.1)
+            assert client.request("status")["metrics"]["tick"] == paused_tick
+
+            #bad requests fail without affecting the simulation
+            try:
+                client.request("load", path=path)
+                assert False, "loading twice should fail"
+            except RuntimeError as e:
+                print(f"expected error: {e}")
+
+            client.request("start")
+
+            #a save that fails is reported, both to the request and in the metrics
+            os.replace(path + "/manifest.json", path + "/manifest.bak")
+            os.mkdir(path + "/manifest.json")
+            try:
+                client.request("save")
+                assert False, "saving over a directory should fail"
+            except RuntimeError as e:
+                print(f"expected error: {e}")
+            assert client.request("status")["metrics"]["failed_saves"] == 1
+            os.rmdir(path + "/manifest.json")
+            os.replace(path + "/manifest.bak", path + "/manifest.json")
+
+            client.request("save")
+            client.request("unload")
+            with open(path + "/manifest.json", "r", encoding="utf-8") as f:
+                saved_tick = json.load(f)["Simulation update"]
+            assert saved_tick > paused_tick
+
+            client.close()
+            stream.close()
+            server.close()
+
+        print(f"{saved_tick} ticks run under remote control, "
+            f"status requests take {status_time*1e3:.3f}ms")
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import numpy as np
+
+from network import Network
+from neuron import Neuron, NeuronParameters
+from population import NeuronPopulation
+from synapse import Synapses
+
+#a genome describes a network as json:
+#   {
+#       "Neurons" : [{"Count" : 1000, "Parameters" : {"excitation_decay" : 0.5}}, ...],
+#       "Connections" : [
+#           {"From" : 0, "To" : 1, "Fan out" : 10, "Weight low" : 0, "Weight high" : 6}, ...
+#       ],
+#       "Seed" : 0
+#   }
+#each entry of "Neurons" is a group of neurons sharing settings (see NeuronParameters), with
+#any settings not given taken from the Neuron class. each entry of "Connections" connects
+#every neuron of one group to "Fan out" random neurons of another, with weights drawn
+#uniformly from ["Weight low", "Weight high"). a connection can also have a "Max delay",
+#giving each synapse a random delay from 1 to that many ticks. "Seed" makes the random
+#choices repeatable
+
+#bumped whenever compile_genome changes what it builds, so older cached networks are
+#no longer used
+compiler_version = 1
+
+#reads a genome from a json file
+def read_genome(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+#returns the (number of neurons, settings) groups of a genome, as for
+#NeuronPopulation.from_groups
+def genome_groups(genome):
+    groups = []
+    for group in genome["Neurons"]:
+        if group["Count"] <= 0:
+            raise ValueError("every neuron group must have at least one neuron")
+        groups.append((group["Count"], NeuronParameters(**group.get("Parameters", {}))))
+
+    return groups
+
+#returns a hash of everything the compiled network depends on: the genome, the default neuron
+#settings any unspecified settings come from, and the compiler version
+def genome_hash(genome):
+    key = {
+        "Genome" : genome,
+        "Defaults" : {name : getattr(Neuron, name) for name in Neuron.parameter_names},
+        "Compiler" : compiler_version
+    }
+
+    return hashlib.blake2b(json.dumps(key, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+#builds the network a genome describes
+def compile_genome(genome):
+    groups = genome_groups(genome)
+    bounds = np.cumsum([0] + [count for count, _ in groups])
+    size = int(bounds[-1])
+
+    pre, post, weights, delays = [], [], [], []
+    for i, connection in enumerate(genome.get("Connections", [])):
+        lo, hi = bounds[connection["From"]], bounds[connection["From"] + 1]
+        target_lo, target_hi = bounds[connection["To"]], bounds[connection["To"] + 1]
+        n_synapses = (hi - lo) * connection["Fan out"]
+
+        #each connection gets its own random stream, so editing one connection doesn't
+        #change the others
+        rng = np.random.default_rng([genome.get("Seed", 0), i])
+        pre.append(np.repeat(np.arange(lo, hi), connection["Fan out"]))
+        post.append(rng.integers(target_lo, target_hi, n_synapses, dtype=np.int32))
+        weights.append(rng.uniform(connection["Weight low"], connection["Weight high"],
+            n_synapses))
+        delays.append(rng.integers(1, connection.get("Max delay", 1) + 1, n_synapses))
+
+    if pre:
+        #only store delays if any connection has them
+        delays = np.concatenate(delays)
+        synapses = Synapses.from_edges(size, size, np.concatenate(pre), np.concatenate(post),
+            np.concatenate(weights), delays if len(delays) and delays.max() > 1 else None)
+    else:
+        synapses = Synapses(size, size, np.zeros(size + 1), [], [])
+
+    return Network(NeuronPopulation.from_groups(groups), synapses)
+
+#a cache of compiled networks inside a directory (i.e. a simulation's Networks directory).
+#each network is stored as the arrays of Network.arrays in a directory named by the hash of
+#its genome, so compiling an unchanged genome again just opens the stored arrays. once the
+#cache grows past max_bytes, the least recently used networks are deleted
+class NetworkCache:
+    #directory: the directory to keep the compiled networks in. created if it doesn't exist
+    #max_bytes: the most disk space the cache may use. the newest network is always kept,
+    #even if it's bigger than this
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    #returns the network a genome describes, compiling it only if it isn't already cached.
+    #cached networks are memory mapped copy-on-write, so opening even a huge one is near
+    #instant and stepping it never changes the cache
+    #genome: the genome, or the path of a genome file
+    def compile(self, genome):
+        if not isinstance(genome, dict):
+            genome = read_genome(genome)
+
+        key = genome_hash(genome)
+        entry = self.directory / key
+        if not entry.exists():
+            self.store(entry, compile_genome(genome))
+            self.evict(keep=key)
+
+        #mark the network as recently used
+        os.utime(entry)
+
+        arrays = {
+            path.stem : np.load(path, mmap_mode="c", allow_pickle=False)
+            for path in entry.glob("*.npy")
+        }
+        return Network.from_arrays(arrays, [params for _, params in genome_groups(genome)])
+
+    #writes a compiled network's arrays to the cache entry at path. like a checkpoint, the
+    #arrays are written to a temporary directory that is then renamed into place, so a crash
+    #never leaves a partial entry. every writer gets its own temporary directory, so several
+    #threads or processes can compile the same genome into one cache at once: the first to
+    #finish stores its entry, and the others find it there and throw their copies away
+    def store(self, path, network):
+        tmp_path = pathlib.Path(tempfile.mkdtemp(dir=self.directory, suffix=".tmp"))
+        try:
+            for name, values in network.arrays().items():
+                with open(tmp_path / (name + ".npy"), "wb") as f:
+                    np.save(f, np.asarray(values), allow_pickle=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                #another writer stored the same network first
+                if not path.exists():
+                    raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    #deletes the least recently used networks until the cache fits in max_bytes
+    #keep: the name of an entry that mustn't be deleted
+    def evict(self, keep=None):
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.suffix == ".tmp":
+                continue
+            try:
+                size = sum(path.stat().st_size for path in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                #evicted by another cache on the same directory meanwhile
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry.name != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+    #returns the number of bytes the cache uses on disk
+    def size(self):
+        return sum(path.stat().st_size for path in self.directory.glob("*/*.npy"))
+
+if __name__ == "__main__":
+    import tempfile
+    import threading
+    import time
+
+    #test settings
+    genome = {
+        "Neurons" : [
+            {"Count" : 150_000, "Parameters" : {}},
+            {"Count" : 50_000, "Parameters" : {"excitation_decay" : 0.5, "spike_threshold" : 12}}
+        ],
+        "Connections" : [
+            {"From" : 0, "To" : 0, "Fan out" : 10, "Weight low" : 0, "Weight high" : 6},
+            {"From" : 0, "To" : 1, "Fan out" : 2, "Weight low" : 0, "Weight high" : 8},
+            {"From" : 1, "To" : 0, "Fan out" : 5, "Weight low" : -4, "Weight high" : 0}
+        ],
+        "Seed" : 0
+    }
+    n_ticks = 200
+
+    def run(network):
+        rng = np.random.default_rng(1)
+        return [network.step(4 * rng.random(len(network))) for _ in range(n_ticks)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = NetworkCache(directory)
+
+        start = time.perf_counter()
+        compiled = cache.compile(genome)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cached = cache.compile(genome)
+        cached_time = time.perf_counter() - start
+
+        #the cached network must behave exactly like a freshly compiled one, and stepping it
+        #mustn't change the cache
+        for a, b in zip(run(compile_genome(genome)), run(cached)):
+            assert np.array_equal(a, b)
+        for a, b in zip(run(compiled), run(cache.compile(genome))):
+            assert np.array_equal(a, b)
+        assert len(list(pathlib.Path(directory).iterdir())) == 1
+
+        print(f"{len(compiled)} neurons, {len(compiled.synapses)} synapses: compiled in "
+            f"{compile_time*1e3:.1f}ms, loaded from cache in {cached_time*1e3:.1f}ms")
+
+        #changing the genome compiles a new network, and the cache evicts the least recently
+        #used ones to stay within its size
+        cache.max_bytes = int(cache.size() * 2.5)
+        for seed in range(1, 5):
+            cache.compile(dict(genome, Seed=seed))
+        assert cache.size() <= cache.max_bytes
+        assert len(list(pathlib.Path(directory).iterdir())) == 2
+        assert (pathlib.Path(directory) / genome_hash(dict(genome, Seed=4))).exists()
+
+        print(f"cache evicted down to {cache.size()} bytes")
+
+        #several caches on the same directory compiling the same genome at once must all get
+        #the network, leaving one entry and no temporary directories behind
+        small = dict(genome, Neurons=[{"Count" : 1000}], Connections=[genome["Connections"][0]])
+        errors = []
+        def open_network():
+            try:
+                NetworkCache(directory).compile(small)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_network) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        assert not list(pathlib.Path(directory).glob("*.tmp"))
+        assert (pathlib.Path(directory) / genome_hash(small)).exists()
+
+        print(f"{len(threads)} caches compiled the same genome at once")
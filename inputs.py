@@ -0,0 +1,227 @@
+import numpy as np
+
+#seeded external input for networks, generated a block of ticks and neurons at a time.
+#the random numbers come from a counter-based generator: each one is a hash of (seed, stream,
+#trial, tick, neuron), rather than the next number of a sequential stream. so any block can
+#be generated on its own, in any order, on any thread or process, and always comes out the
+#same: a network sharded across processes (see ShardedNetwork) or batched (see NetworkBatch)
+#gets exactly the input it would get in one piece
+#
+#every source has:
+#   block(start, n_ticks, lo, hi, trial=0): the input of neurons lo to hi over n_ticks ticks
+#   from start, as a (n_ticks, hi - lo) array
+#   source(tick, lo, hi): the input of one tick, as the input_fn of ShardedNetwork and
+#   precision.compare
+#   source.for_batch(size): the input_fn of NetworkBatch.run, for trials of size neurons.
+#   each trial gets its own random stream
+
+#the constants of splitmix64
+_golden = np.uint64(0x9E3779B97F4A7C15)
+_mix1 = np.uint64(0xBF58476D1CE4E5B9)
+_mix2 = np.uint64(0x94D049BB133111EB)
+
+#hashes an array of uint64s with the splitmix64 finaliser. wraps around on overflow as
+#intended, so numpy's overflow warnings are suppressed
+def _mix(x):
+    with np.errstate(over="ignore"):
+        x = x + _golden
+        x = (x ^ (x >> np.uint64(30))) * _mix1
+        x = (x ^ (x >> np.uint64(27))) * _mix2
+        return x ^ (x >> np.uint64(31))
+
+#returns the key of a (seed, stream, trial) combination, which uniform takes
+def stream_key(seed, stream=0, trial=0):
+    key = np.uint64(0)
+    for counter in (seed, stream, trial):
+        key = _mix(key ^ np.uint64(counter))
+    return key
+
+#returns uniform random numbers in [0, 1) for every tick and neuron of a block, as a
+#(len(ticks), len(neurons)) float64 array. each number depends only on the key, its tick and
+#its neuron
+def uniform(key, ticks, neurons):
+    tick_keys = _mix(key ^ np.asarray(ticks, dtype=np.uint64))
+    bits = _mix(tick_keys[:, None] ^ (np.asarray(neurons, dtype=np.uint64)[None, :]
+        * _golden))
+
+    #the top 53 bits make a double with every value equally likely
+    return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
+
+#mixin giving every input source its per tick and batch forms. the class it's mixed into
+#provides block(start, n_ticks, lo, hi, trial=0), returning the input of neurons lo to hi
+#over n_ticks ticks from start for a trial, as an (n_ticks, hi - lo) array
+class InputSource:
+    #returns the input of neurons lo to hi on one tick
+    def __call__(self, tick, lo, hi):
+        return self.block(tick, 1, lo, hi)[0]
+
+    #returns an input_fn (tick, trials) for NetworkBatch.run with trials of size neurons
+    def for_batch(self, size):
+        def input_fn(tick, trials):
+            return np.stack([self.block(tick, 1, 0, size, trial)[0] for trial in trials])
+        return input_fn
+
+#noise drawn uniformly from [0, high) for every neuron every tick, as the tests have always
+#driven networks with
+class UniformInput(InputSource):
+    #high: the largest input
+    #seed, stream: select the random numbers. sources with the same seed but different
+    #streams are independent, i.e. for different groups of neurons
+    def __init__(self, high, seed=0, stream=0):
+        self.high = high
+        self.seed = seed
+        self.stream = stream
+
+    def block(self, start, n_ticks, lo, hi, trial=0):
+        key = stream_key(self.seed, self.stream, trial)
+        return self.high * uniform(key, np.arange(start, start + n_ticks), np.arange(lo, hi))
+
+#poisson spike trains: each neuron independently gets a spike of input weight on each tick
+#with probability rate
+class PoissonInput(InputSource):
+    #rate: the chance of a spike per neuron per tick. a single value, or one per neuron
+    #weight: the input a spike gives
+    #seed, stream: as for UniformInput
+    def __init__(self, rate, weight, seed=0, stream=0):
+        self.rate = rate
+        self.weight = weight
+        self.seed = seed
+        self.stream = stream
+
+    def block(self, start, n_ticks, lo, hi, trial=0):
+        key = stream_key(self.seed, self.stream, trial)
+        rate = self.rate if np.ndim(self.rate) == 0 else np.asarray(self.rate)[lo:hi]
+
+        spikes = uniform(key, np.arange(start, start + n_ticks), np.arange(lo, hi)) < rate
+        return self.weight * spikes
+
+#noise scaled by a clipped sine wave, as in the neuron.py demo: bursts of input every period
+#ticks, with silence in between when offset is below 1
+class PeriodicInput(InputSource):
+    #amplitude: the largest input
+    #period: the number of ticks per cycle
+    #offset: added to the sine wave before it's clipped to [0, 1]. larger values make longer
+    #bursts
+    #seed, stream: as for UniformInput
+    def __init__(self, amplitude, period, offset=0.75, seed=0, stream=0):
+        self.amplitude = amplitude
+        self.period = period
+        self.offset = offset
+        self.seed = seed
+        self.stream = stream
+
+    def block(self, start, n_ticks, lo, hi, trial=0):
+        key = stream_key(self.seed, self.stream, trial)
+        ticks = np.arange(start, start + n_ticks)
+
+        envelope = np.clip(np.sin(ticks * np.pi * 2 / self.period) + self.offset, 0, 1)
+        return self.amplitude * uniform(key, ticks, np.arange(lo, hi)) * envelope[:, None]
+
+#replays recorded spikes (i.e. from a SpikeRecorder) as input: each recorded spike gives its
+#neuron weight of input on its tick. the same recording is replayed to every trial
+class ReplayInput(InputSource):
+    #events: the recorded spikes, as records of recorder.spike_dtype
+    #weight: the input each spike gives
+    #offset: added to every recorded tick, i.e. to replay a recording later in a run
+    #loop: if given, the recording repeats every loop ticks
+    def __init__(self, events, weight, offset=0, loop=None):
+        #sorted by tick, so each block only looks at its own events
+        events = np.sort(np.asarray(events), order="tick")
+        self.ticks = events["tick"] + offset
+        self.neurons = events["neuron"]
+        self.weight = weight
+        self.offset = offset
+        self.loop = loop
+
+    def block(self, start, n_ticks, lo, hi, trial=0):
+        values = np.zeros((n_ticks, hi - lo))
+        ticks = np.arange(start, start + n_ticks)
+        if self.loop is not None:
+            ticks = (ticks - self.offset) % self.loop + self.offset
+
+        #each tick's events, looked up separately as looped ticks aren't in order
+        first = np.searchsorted(self.ticks, ticks, "left")
+        last = np.searchsorted(self.ticks, ticks, "right")
+        for row, (i, j) in enumerate(zip(first, last)):
+            neurons = self.neurons[i:j]
+            neurons = neurons[(neurons >= lo) & (neurons < hi)]
+            np.add.at(values[row], neurons - lo, self.weight)
+
+        return values
+
+if __name__ == "__main__":
+    import random
+    import threading
+    import time
+
+    from network import Network
+    from recorder import spike_dtype
+    from sharding import ShardedNetwork
+
+    #test settings
+    n_neurons = 100_000
+    n_ticks = 200
+
+    sources = [
+        UniformInput(4, seed=1),
+        PoissonInput(0.01, 20, seed=1),
+        PeriodicInput(4, 400, seed=1),
+        PoissonInput(np.linspace(0, 0.1, n_neurons), 20, seed=1, stream=1)
+    ]
+
+    #any split into blocks of ticks and neurons, made in any order on any thread, must give
+    #exactly the same input as one block
+    for source in sources:
+        whole = source.block(0, n_ticks, 0, n_neurons)
+
+        pieces = np.zeros_like(whole)
+        def fill(lo, hi):
+            for start in range(n_ticks - 10, -1, -10):
+                pieces[start:start + 10, lo:hi] = source.block(start, 10, lo, hi)
+        bounds = np.linspace(0, n_neurons, 5, dtype=int)
+        threads = [threading.Thread(target=fill, args=(lo, hi))
+            for lo, hi in zip(bounds[:-1], bounds[1:])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert np.array_equal(whole, pieces), type(source).__name__
+        assert np.array_equal(whole[17], source(17, 0, n_neurons))
+
+    #the random numbers are uniform, and independent between streams and trials
+    values = uniform(stream_key(0), np.arange(100), np.arange(10_000))
+    assert abs(values.mean() - 0.5) < 0.001 and values.min() >= 0 and values.max() < 1
+    other = uniform(stream_key(0, trial=1), np.arange(100), np.arange(10_000))
+    assert abs(np.corrcoef(values.ravel(), other.ravel())[0, 1]) < 0.01
+
+    #a replayed recording gives the recorded input back
+    events = np.array([(3, 5), (3, 7), (4, 5), (9, 1)], dtype=spike_dtype)
+    replay = ReplayInput(events, 10, offset=100, loop=10)
+    block = replay.block(100, 20, 0, 8)
+    assert block[3, 5] == block[3, 7] == block[4, 5] == block[9, 1] == 10
+    assert np.array_equal(block[:10], block[10:]) and block.sum() == 80
+
+    #a sharded network gets exactly the same input as one in a single process
+    source = UniformInput(4, seed=2)
+    reference = Network.random(20_000, 10, 0, 6, seed=0)
+    sharded = ShardedNetwork(Network.random(20_000, 10, 0, 6, seed=0), input_fn=source)
+    reference_counts = [len(reference.step(source(t, 0, 20_000))) for t in range(50)]
+    assert np.array_equal(reference_counts, sharded.run(50))
+    sharded.close()
+
+    print(f"blocks match split and threaded generation for {len(sources)} sources")
+
+    #the scalar loop the neuron demo used, against a block of the same input for a whole
+    #population
+    start = time.perf_counter()
+    for t in range(n_ticks):
+        envelope = max(min(np.sin(t * np.pi * 2 / 400) + 0.75, 1), 0)
+        scalar = [4 * random.random() * envelope for _ in range(10_000)]
+    scalar_time = (time.perf_counter() - start) / (n_ticks * 10_000)
+
+    start = time.perf_counter()
+    sources[2].block(0, n_ticks, 0, n_neurons)
+    block_time = (time.perf_counter() - start) / (n_ticks * n_neurons)
+
+    print(f"scalar: {scalar_time*1e9:.1f}ns per input, blocks: {block_time*1e9:.1f}ns per input")
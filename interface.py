@@ -1,18 +1,27 @@
 import tkinter as tk
 import tkinter.filedialog as tkfd
 
-#main user interface for the simulation
+#returns a metric's value as text for the status, with numbers kept short
+def format_metric(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"{value:.6g}"
+    return str(value)
+
+#main user interface for the simulation. a client of a control server (see control.py), so
+#it can drive a simulation in this process or one running headless elsewhere
 class SimulationWindow(tk.Frame):
+    #how often the status shown is refreshed, in milliseconds
+    status_interval_ms = 1000
 
     #sets up the window
-    def __init__(self, sim_class, parent):
+    #client: the ControlClient to send commands through
+    def __init__(self, client, parent):
         #set up the frame
         self.parent = parent
         tk.Frame.__init__(self, self.parent)
 
-        #store simulation class and initialise variables
-        self.sim_class = sim_class
-        self.sim_instance = None
+        #store the client
+        self.client = client
 
         #configure the window and make the widgets
         self.configure_gui()
@@ -22,6 +31,8 @@ class SimulationWindow(tk.Frame):
         self.simulation_running = False
         self.simulation_loaded = False
 
+        self.update_status()
+
     #configures the window for use
     def configure_gui(self):
         #window properties
@@ -65,22 +76,29 @@ class SimulationWindow(tk.Frame):
     #called when the window is to be closed
     def close_window(self):
         #stop and save the simulation before exiting
-        if not self.sim_instance is None:
-            self.sim_instance.stop()
-            self.sim_instance.save()
+        if self.simulation_loaded:
+            self.client.request("unload")
 
         self.parent.destroy()
 
+    #shows the simulation's live metrics, and schedules the next update
+    def update_status(self):
+        status = self.client.request("status")
+        if status["loaded"]:
+            metrics = status["metrics"]
+            self.active_sim_lbl.config(text=f"Active simulation: {status['path']}\n"
+                + "\n".join(f"{name}: {format_metric(value)}" for name, value in metrics.items()))
+
+        self.parent.after(SimulationWindow.status_interval_ms, self.update_status)
+
     #loads or unloads a simulation, depending on if a simulation is already loaded
     def toggle_load_sim(self):
         if self.simulation_loaded:
             print("Unloading simulation...")
             self.load_unload_bttn.config(text="Load simulation")
 
-            #stop the simulation, save, and destroy the instance
-            self.sim_instance.stop()
-            self.sim_instance.save()
-            self.sim_instance = None
+            #stop the simulation, save, and unload it
+            self.client.request("unload")
 
             #reset the buttons
             self.simulation_running = False
@@ -96,74 +114,67 @@ class SimulationWindow(tk.Frame):
             if path == "":
                 return
 
-            #only proceed if instance creation was successful
-            self.sim_instance = self.sim_class.load_sim(path)
-            if not self.sim_instance is None:
-                print("Loading simulation...")
-                self.load_unload_bttn.config(text="Unload simulation")
+            #only proceed if loading was successful
+            try:
+                self.client.request("load", path=path)
+            except RuntimeError as e:
+                print(f"Couldn't load simulation: {e}")
+                return
 
-                self.simulation_loaded = True
-                self.active_sim_lbl.config(text=f"Active simulation: {path}")
+            print("Loading simulation...")
+            self.load_unload_bttn.config(text="Unload simulation")
 
-    #saves the currently loaded simulation
+            self.simulation_loaded = True
+            self.active_sim_lbl.config(text=f"Active simulation: {path}")
+
+    #saves the currently loaded simulation. the simulation keeps running while it is written
     def save_sim(self):
-        #guard clause: exit if we don't have a sim instance
-        if self.sim_instance is None:
+        #guard clause: exit if we don't have a simulation
+        if not self.simulation_loaded:
             return
 
         print("Saving simulation...")
-        #stop the simulation, save, and restart
-        was_paused = self.sim_instance.sim_paused
-        was_active = self.sim_instance.has_started()
-
-        self.sim_instance.stop()
-        self.sim_instance.save()
-
-        #start the simulation if it was already started before saving
-        if was_active:
-            self.sim_instance.start()
-
-        #pause the simulation if it was already paused before saving
-        if was_paused:
-            self.sim_instance.pause()
+        self.client.request("save")
 
     #switches the simulation from on/off to off/on respectively
     def toggle_run_sim(self):
-        #guard clause: exit if we don't have a sim instance
-        if self.sim_instance is None:
+        #guard clause: exit if we don't have a simulation
+        if not self.simulation_loaded:
             return
 
         if self.simulation_running:
             print("Pausing simulation...")
             self.start_stop_bttn.config(text="Unpause simulation")
 
-            self.sim_instance.pause()
+            self.client.request("pause")
 
             self.simulation_running = False
         else:
             print("Starting simulation...")
             self.start_stop_bttn.config(text="Pause simulation")
 
-            #only unpause if there's a thread already. otherwise, start one
-            if self.sim_instance.has_started():
-                self.sim_instance.unpause()
-            else:
-                self.sim_instance.start()
+            #the server unpauses if there's a thread already. otherwise, it starts one
+            self.client.request("start")
 
             self.simulation_running = True
 
-    #calls the simulation class' make_dir method
+    #creates a new simulation through the server
     def create_sim(self):
         #get simulation directory to open
         path = tkfd.askdirectory()
 
-        #pass to simulation class
-        self.sim_class.create_new_sim(path + "/New Simulation")
+        #exit if empty path (no directory selected)
+        if path == "":
+            return
+
+        #pass to the server's simulation class
+        self.client.request("create", path=path + "/New Simulation")
 
 if __name__ == "__main__":
+    from control import ControlClient, ControlServer
     from simulation import Simulation
+    import argparse
     import pathlib
-    import time
     import json
 
     #console colours
@@ -175,15 +186,16 @@ if __name__ == "__main__":
             Simulation.__init__(self, path, **kwargs)
 
             self.tick = self.manifest["Simulation update"]
+            self.tick_rate = 4
 
             print(kwargs, sep="\n")
 
-        def save(self):
+        def sync_state(self):
             #update the manifest
             self.manifest["Simulation update"] = self.tick
 
-            #call the parent class' save method to save the manifest
-            Simulation.save(self)
+        def metrics(self):
+            return dict(Simulation.metrics(self), tick=self.tick)
 
         @staticmethod
         def configure_new_sim(path):
@@ -191,8 +203,6 @@ if __name__ == "__main__":
             manifest = {
                 "Genomes Directory" : "Genomes",
                 "Networks Directory" : "Networks",
-                "Genomes" : [],
-                "Networks" : [],
                 "Simulation update" : 0
             }
             with open(path + "/manifest.json", "w", encoding="utf-8") as f:
@@ -202,32 +212,42 @@ if __name__ == "__main__":
             pathlib.Path(path + "/Genomes").mkdir()
             pathlib.Path(path + "/Networks").mkdir()
 
+        #performs one simulation tick
+        def do_tick(self):
+            #each simulation tick goes here
+            self.tick += 1
+            Simulation.log(f"Tick {self.tick}: Doing cool simulation stuff... ", key="tick")
+
         #thread target for the simulation thread
         def sim_thread_target(self):
-            self.sim_stopped = False
-
             #simulation setup goes here
             Simulation.log("Initialising simulation...")
 
-            #update loop
-            while self.sim_running:
-                self.sim_active = True
-                
-                #each simulation tick goes here
-                time.sleep(0.25)
-                self.tick += 1
-                Simulation.log(f"Tick {self.tick}: Doing cool simulation stuff... ")
-
-                #wait until the simulation is unpaused before doing the next tick
-                while self.sim_paused and self.sim_running:
-                    self.sim_active = False
-                    time.sleep(0.1)
+            #update loop. runs do_tick until the simulation is stopped, waiting while paused
+            self.step_loop(self.do_tick)
 
             #simulation cleanup goes here
             Simulation.log("Simulation closing...")
-            self.sim_stopped = True
 
 
+    #control a simulation server running elsewhere, or one started here
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connect", help="host:port of a control server to connect to")
+    args = parser.parse_args()
+
+    server = None
+    if args.connect is None:
+        server = ControlServer(TestSim)
+        address = server.address
+    else:
+        host, port = args.connect.rsplit(":", 1)
+        address = (host, int(port))
+    client = ControlClient(*address)
+
     root = tk.Tk()
-    window = SimulationWindow(TestSim, root)
-    root.mainloop()
\ No newline at end of file
+    window = SimulationWindow(client, root)
+    root.mainloop()
+
+    client.close()
+    if server is not None:
+        server.close()
\ No newline at end of file
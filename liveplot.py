@@ -0,0 +1,62 @@
+import numpy as np
+
+from recorder import RingBuffer
+
+#reduces a long series to at most two points per bucket: the minimum and maximum of the
+#samples in that bucket. with one bucket per pixel, the plot looks the same as the full
+#series (short spikes never disappear), but costs the same to draw however long it is
+#returns the decimated (x, y)
+def decimate(x, y, n_buckets):
+    if len(x) <= 2 * n_buckets:
+        return x, y
+
+    starts = np.linspace(0, len(x), n_buckets + 1).astype(int)[:-1]
+    mins = np.minimum.reduceat(y, starts)
+    maxs = np.maximum.reduceat(y, starts)
+
+    #draw each bucket as a vertical stroke from its minimum to its maximum
+    return np.repeat(x[starts], 2), np.column_stack((mins, maxs)).ravel()
+
+#live line plots of a fixed-size window of the most recent samples. samples are added in
+#batches and the lines are redrawn once per batch from a decimated copy of the window, so
+#the cost of a frame stays the same however long the run is
+class LivePlot:
+    #lines: the matplotlib lines to draw, one per column of the samples
+    #window: the number of most recent ticks to show
+    #resolution: the number of buckets each line is decimated to. about the plot's width in
+    #pixels looks the same as drawing every sample
+    def __init__(self, lines, window, resolution=1000):
+        self.lines = list(lines)
+        self.window = window
+        self.resolution = resolution
+
+        sample_dtype = np.dtype([("tick", np.int64), ("values", np.float64, (len(self.lines),))])
+        self.buffer = RingBuffer(window, sample_dtype)
+        self.axes = {line.axes for line in self.lines}
+
+    #adds a batch of samples
+    #ticks: array of the tick of each sample
+    #values: array of shape (samples, lines)
+    def extend(self, ticks, values):
+        samples = np.empty(len(ticks), dtype=self.buffer.data.dtype)
+        samples["tick"] = ticks
+        samples["values"] = values
+        self.buffer.extend(samples)
+
+    #redraws the lines from the current window and scrolls the axes to follow it
+    #returns the lines, for matplotlib animations
+    def update(self):
+        samples = self.buffer.values()
+        if len(samples) == 0:
+            return self.lines
+
+        ticks = samples["tick"]
+        for i, line in enumerate(self.lines):
+            line.set_data(*decimate(ticks, samples["values"][:, i], self.resolution))
+
+        #keep the window's width fixed, and scroll once the run is longer than it
+        right = max(ticks[-1], self.window)
+        for axis in self.axes:
+            axis.set_xlim(right - self.window, right)
+
+        return self.lines
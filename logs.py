@@ -0,0 +1,159 @@
+import logging
+import logging.handlers
+import pathlib
+import queue
+import threading
+import time
+
+#the logger every simulation logs to (see Simulation.log). it only puts records on a queue,
+#which a background thread takes them from to write to the console and any log files, so
+#logging never waits on the terminal or the disk
+logger = logging.getLogger("simulation")
+logger.propagate = False
+
+_queue = queue.SimpleQueue()
+_listener = None
+_files = {}
+#guards _listener and _files, which are changed from whichever thread (un)loads simulations
+_lock = threading.Lock()
+
+#formats records for the console, with the coloured prefix the simulation thread has always
+#used. warnings and errors are marked with their level
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        level = "" if record.levelno <= logging.INFO else f"[{record.levelname}] "
+        return f"\u001b[36m<<<SIMULATION THREAD>>>\u001b[0m {level}{record.getMessage()}"
+
+#limits records that share a key to one per interval seconds. records without a key always
+#pass. the next record to get through says how many were dropped in between, so per-tick
+#messages become a periodic sample instead of flooding the log
+class RateLimiter(logging.Filter):
+    def __init__(self, interval=1):
+        logging.Filter.__init__(self)
+        self.interval = interval
+
+        #the time each key last got through, and how many records with it have been dropped
+        #since
+        self.last = {}
+        self.dropped = {}
+
+    def filter(self, record):
+        key = getattr(record, "key", None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        if now - self.last.get(key, -self.interval) < self.interval:
+            self.dropped[key] = self.dropped.get(key, 0) + 1
+            return False
+
+        self.last[key] = now
+        dropped = self.dropped.pop(key, 0)
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        return True
+
+#the rate limiter on the simulation logger
+rate_limiter = RateLimiter()
+
+#(re)starts the background writer with the console and the current log files. the old
+#writer finishes writing everything queued before it stops
+def _restart_listener():
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+
+    console = logging.StreamHandler()
+    console.setFormatter(ConsoleFormatter())
+    _listener = logging.handlers.QueueListener(_queue, console, *_files.values())
+    _listener.start()
+
+#sets up the simulation logger, if it isn't already. called on first use by Simulation.log,
+#but can be called earlier to set the level
+#level: the lowest level of record to log
+def start(level=logging.INFO):
+    with _lock:
+        logger.setLevel(level)
+        if _listener is not None:
+            return
+
+        logger.addHandler(logging.handlers.QueueHandler(_queue))
+        logger.addFilter(rate_limiter)
+        _restart_listener()
+
+#also writes the log to rotating files in a directory, i.e. inside a simulation
+#max_bytes: the size a file may reach before it's rotated
+#backup_count: the number of rotated files to keep
+def log_to_directory(directory, max_bytes=1 << 20, backup_count=5):
+    start(logger.level or logging.INFO)
+
+    with _lock:
+        if directory in _files:
+            return
+
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(directory + "/simulation.log",
+            maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+        _files[directory] = handler
+        _restart_listener()
+
+#stops writing the log to a directory given to log_to_directory, once everything already
+#logged has been written
+def stop_logging_to_directory(directory):
+    with _lock:
+        handler = _files.pop(directory, None)
+        if handler is None:
+            return
+
+        _restart_listener()
+        handler.close()
+
+#writes everything logged so far and stops the background writer. logging again starts it
+#again
+def stop():
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        logger.removeFilter(rate_limiter)
+
+if __name__ == "__main__":
+    import tempfile
+
+    #test settings
+    n_messages = 100_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_to_directory(directory, max_bytes=64 * 1024, backup_count=2)
+
+        #per tick messages are rate limited, so only about one a second gets through
+        start_time = time.perf_counter()
+        for i in range(n_messages):
+            logger.info(f"Tick {i}", extra={"key" : "tick"})
+        keyed_time = time.perf_counter() - start_time
+
+        #the caller only pays for queueing the record, not for writing it
+        start_time = time.perf_counter()
+        for i in range(20):
+            logger.debug(f"Tick {i}")
+            logger.info(f"unlimited message {i}")
+        queued_time = (time.perf_counter() - start_time) / 20
+
+        logger.warning("done")
+        stop_logging_to_directory(directory)
+        stop()
+
+        files = sorted(pathlib.Path(directory).glob("simulation.log*"))
+        text = files[0].read_text(encoding="utf-8")
+        assert "WARNING done" in text and not "DEBUG" in text
+        assert len(files) <= 3
+
+        print(f"{n_messages} rate limited messages logged in {keyed_time*1e3:.1f}ms, "
+            f"unlimited messages take {queued_time*1e6:.1f}us each to log")
@@ -0,0 +1,339 @@
+import numpy as np
+
+from neuron import Neuron, NeuronParameters
+from plasticity import STDP
+from population import NeuronPopulation
+from synapse import DelayQueue, Synapses
+
+#a population of neurons connected to itself by a set of synapses. each tick, the output
+#spikes of the previous tick are fed through the synapses to produce the neurons' swi. if
+#the synapses have delays, spikes arrive as swi that many ticks later instead
+class Network:
+    #sets up the network. synapses must connect the population to itself
+    #event_driven: if true, only neurons that receive input or are still active are stepped
+    #each tick. dormant neurons (see NeuronPopulation.dormant) are skipped until input
+    #arrives, and then caught up in closed form, so the results match a dense step within
+    #float tolerance. (the closed form can round differently to repeated steps, so a neuron
+    #whose excitation lands exactly on the spike threshold may spike in one and not the other)
+    def __init__(self, population, synapses, event_driven=False):
+        if synapses.n_pre != len(population) or synapses.n_post != len(population):
+            raise ValueError("synapses must connect the population to itself")
+
+        self.population = population
+        self.synapses = synapses
+        self.event_driven = event_driven
+
+        #indices of the neurons that spiked on the previous tick, and the number of ticks
+        #performed
+        self.spikes = np.flatnonzero(population.output())
+        self.tick = 0
+
+        #event driven bookkeeping: the tick each neuron's state is current to, and the
+        #neurons that aren't dormant and so must be stepped every tick
+        self.updated = np.zeros(len(population), dtype=np.int64)
+        self.awake = np.flatnonzero(~population.dormant())
+
+        #input in flight along delayed synapses
+        self.queue = None if synapses.delays is None else DelayQueue(synapses)
+
+        #optional PhaseTimer (see profiling.py) to mark the propagation and update phases of
+        #each step with
+        self.timer = None
+
+        #optional plasticity rule (i.e. plasticity.STDP) applied to the spikes of every step.
+        #its time is marked as the plasticity phase
+        self.plasticity = None
+
+    #builds a network of size neurons with random connectivity. see Synapses.random
+    #dtype: the type of the neuron state and synaptic weights, i.e. float32 for half the memory
+    #max_delay: if more than 1, each synapse gets a random delay from 1 to max_delay ticks
+    @classmethod
+    def random(cls, size, fan_out, weight_low, weight_high, seed=None, event_driven=False,
+            dtype=np.float64, max_delay=1):
+        synapses = Synapses.random(size, size, fan_out, weight_low, weight_high, seed, dtype,
+            max_delay)
+        return cls(NeuronPopulation(size, dtype=dtype), synapses, event_driven)
+
+    #rebuilds a network from the arrays returned by arrays(), i.e. a loaded checkpoint. the
+    #arrays are used directly, so memory mapped arrays stay memory mapped. a saved
+    #plasticity rule is reattached, carrying on from its traces
+    #params: the settings the population uses (see NeuronPopulation). defaults to the
+    #settings saved in the arrays, if any
+    @classmethod
+    def from_arrays(cls, arrays, params=None, event_driven=False):
+        size = len(arrays["excitation"])
+        if params is None and "param_table" in arrays:
+            params = cls.table_parameters(arrays["param_table"])
+            if not "param_index" in arrays:
+                params = params[0]
+        population = NeuronPopulation(size, params, arrays.get("param_index"),
+            arrays["excitation"].dtype, state=arrays)
+        synapses = Synapses(size, size, arrays["indptr"], arrays["targets"], arrays["weights"],
+            delays=arrays.get("delays"))
+
+        network = cls(population, synapses, event_driven)
+        network.spikes = np.asarray(arrays["spikes"])
+        network.tick = int(arrays["tick"])
+        network.updated[:] = network.tick
+        if "pending" in arrays:
+            network.queue = DelayQueue(synapses, arrays["pending"])
+        if "stdp_settings" in arrays:
+            network.plasticity = STDP.from_arrays(synapses, arrays)
+        return network
+
+    #returns a copy of the network with its neuron state and synaptic weights converted to
+    #dtype, and its own copy of any plasticity rule, i.e. to compare a network's results at
+    #reduced precision (see precision.py)
+    def astype(self, dtype):
+        arrays = dict(self.arrays())
+        for name in NeuronPopulation.state_names + ("weights",):
+            arrays[name] = arrays[name].astype(dtype)
+        arrays["spikes"] = arrays["spikes"].copy()
+        for name in ("pending",) + STDP.state_names:
+            if name in arrays:
+                arrays[name] = arrays[name].copy()
+
+        return Network.from_arrays(arrays, self.population.params, self.event_driven)
+
+    #returns the network's state and connectivity as a dict of named arrays, i.e. for
+    #Simulation.state. skipped neurons are brought up to date first
+    def arrays(self):
+        self.sync()
+
+        arrays = {name : getattr(self.population, name) for name in NeuronPopulation.state_names}
+        arrays["indptr"] = self.synapses.indptr
+        arrays["targets"] = self.synapses.targets
+        arrays["weights"] = self.synapses.weights
+        arrays["spikes"] = self.spikes
+        arrays["tick"] = np.array(self.tick)
+        if self.population.param_index is not None:
+            arrays["param_index"] = self.population.param_index
+        if self.population.params is not Neuron:
+            arrays["param_table"] = self.parameter_table(self.population.params)
+        if self.queue is not None:
+            arrays["delays"] = self.synapses.delays
+            arrays["pending"] = self.queue.pending
+        if self.plasticity is not None:
+            arrays.update(self.plasticity.arrays())
+
+        return arrays
+
+    #returns settings (a NeuronParameters, or a list of them) as a table with a row per set
+    #of settings and a column per setting, in the order of Neuron.parameter_names, so they
+    #can be saved with the rest of the arrays
+    @staticmethod
+    def parameter_table(params):
+        if not isinstance(params, (list, tuple)):
+            params = [params]
+        return np.array([[getattr(p, name) for name in Neuron.parameter_names] for p in params],
+            dtype=np.float64)
+
+    #returns the list of NeuronParameters a table from parameter_table holds
+    @staticmethod
+    def table_parameters(table):
+        return [
+            NeuronParameters(**{name : float(value)
+                for name, value in zip(Neuron.parameter_names, row)})
+            for row in np.asarray(table)
+        ]
+
+    #performs one timestep of the network
+    #external: optional array (or scalar) of external input added to every neuron's swi
+    #returns the indices of the neurons that spiked
+    def step(self, external=None):
+        if self.event_driven:
+            self.spikes = self._step_events(external)
+        else:
+            swi = self._propagate_dense()
+            if external is not None:
+                swi += external
+            if self.timer is not None:
+                self.timer.mark("propagation")
+
+            self.spikes = np.flatnonzero(self.population.step(swi))
+            if self.timer is not None:
+                self.timer.mark("update")
+
+        if self.plasticity is not None:
+            self.plasticity.update(self.tick, self.spikes)
+            if self.timer is not None:
+                self.timer.mark("plasticity")
+
+        self.tick += 1
+        return self.spikes
+
+    #returns this tick's swi from the synapses
+    def _propagate_dense(self):
+        if self.queue is None:
+            return self.synapses.compute_swi(self.spikes)
+
+        self.queue.push(self.tick, self.spikes)
+        return self.queue.pop(self.tick)
+
+    #event driven timestep. see step
+    def _step_events(self, external):
+        #only the neurons that spiked push their contributions to their targets
+        if self.queue is None:
+            targets, contributions = self.synapses.propagate(self.spikes)
+        else:
+            #delayed input is summed densely, but only the neurons it reaches are stepped
+            swi = self._propagate_dense()
+            targets = np.flatnonzero(swi)
+            contributions = swi[targets]
+        if self.timer is not None:
+            self.timer.mark("propagation")
+
+        #the neurons to step: those still active, those receiving spikes and those receiving
+        #external input
+        touched = np.union1d(self.awake, targets)
+        if external is not None:
+            external = np.broadcast_to(external, (len(self),))
+            touched = np.union1d(touched, np.flatnonzero(external))
+
+        swi = np.zeros(len(touched))
+        swi[np.searchsorted(touched, targets)] = contributions
+        if external is not None:
+            swi += external[touched]
+
+        #catch up any neurons that were skipped while dormant
+        missed = self.tick - self.updated[touched]
+        lagging = missed > 0
+        self.population.decay(touched[lagging], missed[lagging])
+
+        spiked = self.population.step_subset(touched, swi)
+        self.updated[touched] = self.tick + 1
+
+        self.awake = touched[~self.population.dormant(touched)]
+        if self.timer is not None:
+            self.timer.mark("update")
+        return touched[spiked]
+
+    #brings skipped neurons' state up to date so the population can be read directly.
+    #does nothing outside of event driven mode
+    #index: optional array of the neurons to bring up to date. defaults to all of them
+    def sync(self, index=None):
+        if not self.event_driven:
+            return
+
+        if index is None:
+            index = np.arange(len(self))
+        missed = self.tick - self.updated[index]
+        lagging = missed > 0
+        self.population.decay(index[lagging], missed[lagging])
+        self.updated[index] = self.tick
+
+    #returns the number of neurons in the network
+    def __len__(self):
+        return len(self.population)
+
+if __name__ == "__main__":
+    import time
+
+    from neuron import Neuron
+
+    #test settings
+    n_neurons = 500
+    n_ticks = 1000
+
+    #drive a network and the same number of scalar neurons fed from the same synapses
+    network = Network.random(n_neurons, 20, 0, 8, seed=0)
+    neurons = [Neuron() for _ in range(n_neurons)]
+    scalar_spikes = np.zeros(n_neurons, dtype=bool)
+
+    rng = np.random.default_rng(1)
+    n_spikes = 0
+    for t in range(n_ticks):
+        external = 4 * rng.random(n_neurons)
+
+        #the swi from the synapses is the input feed for each Neuron.step
+        swi = network.synapses.compute_swi(scalar_spikes) + external
+        scalar_spikes = np.array([n.step(x) for n, x in zip(neurons, swi)], dtype=bool)
+
+        spikes = network.step(external)
+        assert np.array_equal(spikes, np.flatnonzero(scalar_spikes)), f"tick {t}"
+        n_spikes += len(spikes)
+
+    print(f"{n_ticks} ticks of {n_neurons} connected neurons match, {n_spikes} spikes")
+
+    #a heterogeneous network's settings must be saved with its arrays, so a checkpoint can be
+    #resumed without them
+    from neuron import NeuronParameters
+    groups = [(300, NeuronParameters()), (200, NeuronParameters(excitation_decay=0.5))]
+    mixed = Network(NeuronPopulation.from_groups(groups), network.synapses)
+    resumed = Network.from_arrays({name : np.copy(values)
+        for name, values in mixed.arrays().items()})
+    for t in range(100):
+        external = 4 * rng.random(n_neurons)
+        assert np.array_equal(mixed.step(external), resumed.step(external)), f"tick {t}"
+
+    #event driven and dense networks driven by sparse input must produce the same spikes
+    n_neurons = 100_000
+    dense = Network.random(n_neurons, 10, 0, 3, seed=2)
+    events = Network.random(n_neurons, 10, 0, 3, seed=2, event_driven=True)
+
+    rng = np.random.default_rng(3)
+    dense_time = event_time = 0
+    for t in range(n_ticks):
+        external = np.zeros(n_neurons)
+        external[rng.integers(0, n_neurons, 100)] = rng.uniform(15, 30, 100)
+
+        start = time.perf_counter()
+        dense_spikes = dense.step(external)
+        dense_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        event_spikes = events.step(external)
+        event_time += time.perf_counter() - start
+
+        assert np.array_equal(dense_spikes, event_spikes), f"tick {t}"
+
+    events.sync()
+    for name in NeuronPopulation.state_names:
+        assert np.allclose(getattr(dense.population, name), getattr(events.population, name))
+
+    print(f"event driven matches dense over {n_ticks} ticks of {n_neurons} neurons")
+
+    #delayed synapses must deliver each spike's input exactly delay ticks later. check
+    #against scalar neurons fed from a queue of (arrival tick, target, weight) per synapse
+    n_small = 300
+    delayed = Network.random(n_small, 20, 0, 8, seed=4, max_delay=5)
+    synapses = delayed.synapses
+    neurons = [Neuron() for _ in range(n_small)]
+    in_flight = {}
+
+    rng = np.random.default_rng(5)
+    for t in range(n_ticks):
+        external = 4 * rng.random(n_small)
+
+        swi = external.copy()
+        for target, weight in in_flight.pop(t, []):
+            swi[target] += weight
+        scalar_spikes = [i for i, (n, x) in enumerate(zip(neurons, swi)) if n.step(x)]
+        for i in scalar_spikes:
+            for j in range(synapses.indptr[i], synapses.indptr[i + 1]):
+                arrival = t + int(synapses.delays[j])
+                in_flight.setdefault(arrival, []).append(
+                    (synapses.targets[j], synapses.weights[j]))
+
+        assert np.array_equal(delayed.step(external), scalar_spikes), f"tick {t}"
+
+    #with every delay 1, the queue must give exactly the same results as no delays
+    plain = Network.random(n_small, 20, 0, 8, seed=4)
+    unit = Network(NeuronPopulation(n_small), Synapses(n_small, n_small, plain.synapses.indptr,
+        plain.synapses.targets, plain.synapses.weights, delays=np.ones(len(plain.synapses))))
+    for t in range(n_ticks):
+        external = 4 * rng.random(n_small)
+        assert np.array_equal(plain.step(external), unit.step(external)), f"tick {t}"
+
+    #delays must survive a checkpoint, and work event driven
+    delayed_events = Network.from_arrays(
+        {name : np.copy(values) for name, values in delayed.arrays().items()}, event_driven=True)
+    for t in range(n_ticks):
+        external = np.zeros(n_small)
+        external[rng.integers(0, n_small, 10)] = rng.uniform(15, 30, 10)
+        assert np.array_equal(delayed.step(external), delayed_events.step(external)), f"tick {t}"
+
+    print(f"delays of up to {synapses.max_delay} ticks match queued scalar neurons, "
+        f"{delayed.queue.pending.nbytes} bytes of pending input")
+    print(f"dense: {dense_time/n_ticks*1e3:.3f}ms/tick, event driven: "
+        f"{event_time/n_ticks*1e3:.3f}ms/tick")
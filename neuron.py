@@ -11,8 +11,8 @@ class Neuron:
 
     #TODO base these off of literature. default values should assume 1ms/timestep 
     #(SUBJECT TO CHANGE, ALSO BASED ON LITERATURE. PROVIDE SOURCES!)
-    #TODO some factors could be provided as optional parameters in the constructor
-    #(i.e. excitation_decay)
+    #individual neurons or groups of neurons can use different values by passing a
+    #NeuronParameters to the constructor (see below)
 
     #NOTE it looks like when this is actually being used, most coefficients will have to be
     #dialed way down, including the timestep duration. would probably need to tick these once
@@ -49,55 +49,101 @@ class Neuron:
     #the amount that charge decays by each timestep. irrespective of any other factors. additive
     charge_decay = 1
 
-    def __init__(self):
+    #per-neuron attributes. slots keep each instance to a few pointers instead of a dict
+    __slots__ = ("excitation", "charge", "refractory_state", "neurotrans", "params")
+
+    #the names of all of the settings above
+    parameter_names = (
+        "spike_threshold", "spike_charge", "spike_cost_coeff", "refractory_period",
+        "available_neurotrans", "reuptake_coeff", "neurotrans_threshold", "excitation_decay",
+        "refractory_decay", "charge_decay"
+    )
+
+    #params: the settings this neuron uses. defaults to the class variables above, so global
+    #changes still apply. a NeuronParameters can be shared between any number of neurons
+    #kwargs: individual settings to override, i.e. Neuron(excitation_decay=0.1)
+    def __init__(self, params=None, **kwargs):
+        if kwargs:
+            params = NeuronParameters(params, **kwargs)
+        self.params = Neuron if params is None else params
+
         #initialise the neuron's internal state
         self.excitation = 0
         self.charge = 0
         self.refractory_state = 0
-        self.neurotrans = Neuron.available_neurotrans
+        self.neurotrans = self.params.available_neurotrans
 
     #TODO: explain what each of these variables represent
 
     #performs one timestep for this neuron
     #swi: the sum of the neuron's weighted inputs
     def step(self, swi):
+        params = self.params
+
         #update excitation
-        self.excitation -= Neuron.excitation_decay
+        self.excitation -= params.excitation_decay
         self.excitation += swi
 
         #are we spiking?
         if self.charge > 0:
             #apply neurotransmitter cost. proportional to output strength
-            self.neurotrans = max(self.neurotrans - Neuron.spike_cost_coeff * self.output(), 0)
+            self.neurotrans = max(self.neurotrans - params.spike_cost_coeff * self.output(), 0)
             #end the spike if we run out of neurotransmitters
             if self.neurotrans == 0:
                 self.charge = 0
 
             #apply charge decay, but ensure charge never drops below zero
-            self.charge = max(self.charge - Neuron.charge_decay, 0)
+            self.charge = max(self.charge - params.charge_decay, 0)
 
             
         #update refractory state
         if self.refractory_state > 0:
             #apply refractory state decay, but ensure refractory_state never drops below zero
-            self.refractory_state = max(self.refractory_state - Neuron.refractory_decay, 0)
+            self.refractory_state = max(self.refractory_state - params.refractory_decay, 0)
 
         #update neurotransmitters
-        self.neurotrans += Neuron.reuptake_coeff * (Neuron.available_neurotrans - self.neurotrans)
+        self.neurotrans += params.reuptake_coeff * (params.available_neurotrans - self.neurotrans)
 
         #check for spike threshold
-        if self.excitation > Neuron.spike_threshold:
+        if self.excitation > params.spike_threshold:
             #only spike if we're not in a refractory state and have enough neurotransmitters
-            if self.refractory_state == 0 and self.neurotrans >= Neuron.neurotrans_threshold:
+            if self.refractory_state == 0 and self.neurotrans >= params.neurotrans_threshold:
                 #start a spike, reset excitation and enter a refractory state
-                self.charge = Neuron.spike_charge
+                self.charge = params.spike_charge
                 self.excitation = 0
-                self.refractory_state = Neuron.refractory_period
+                self.refractory_state = params.refractory_period
 
 
 
         return self.output()
 
+    #performs k timesteps without input. once the neuron is dormant (see below), the
+    #remaining ticks are applied at once in closed form, so this costs the same however large
+    #k is, and matches k calls to step(0) within float tolerance
+    def advance(self, k):
+        params = self.params
+
+        #a neuron still spiking or above threshold has to be stepped until it settles
+        while k > 0 and not self.dormant():
+            self.step(0)
+            k -= 1
+
+        if k > 0:
+            #excitation and refractory_state decay linearly, with refractory_state stopping
+            #at zero. the distance to the baseline neurotransmitter level shrinks geometrically
+            self.excitation -= k * params.excitation_decay
+            self.refractory_state = max(self.refractory_state - k * params.refractory_decay, 0)
+            remaining = (1 - params.reuptake_coeff) ** k
+            self.neurotrans = params.available_neurotrans \
+                - (params.available_neurotrans - self.neurotrans) * remaining
+
+        return self.output()
+
+    #returns true if the neuron can never spike again without input: it isn't spiking, and
+    #excitation, which only decays without input, is at or below the spike threshold
+    def dormant(self):
+        return self.charge == 0 and self.excitation <= self.params.spike_threshold
+
     #returns the output state of the neuron at the current internal state
     def output(self):
         return 1 if self.charge > 0 else 0
@@ -111,15 +157,40 @@ class Neuron:
 
         return txt
 
+#a set of neuron settings that can be shared by any number of neurons, for networks with
+#several different types of neuron. has the same attributes as the Neuron class variables
+class NeuronParameters:
+    #base: the settings to copy any unspecified values from. defaults to the Neuron class
+    #kwargs: settings to override, named as in Neuron.parameter_names
+    def __init__(self, base=None, **kwargs):
+        base = Neuron if base is None else base
+
+        for name in kwargs:
+            if not name in Neuron.parameter_names:
+                raise TypeError(f"unknown neuron parameter '{name}'")
+
+        for name in Neuron.parameter_names:
+            setattr(self, name, kwargs.get(name, getattr(base, name)))
+
+    #returns a string representation of the settings
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)}" for name in Neuron.parameter_names)
+        return f"NeuronParameters({values})"
+
 if __name__ == "__main__":
-    import random
     import matplotlib.animation as animation
     import matplotlib.pyplot as plt
     import numpy as np
 
+    from inputs import PeriodicInput
+    from liveplot import LivePlot
+
     #test settings
-    n_ticks = 2000
-    tick_delay_ms = 20
+    n_ticks = 100_000
+    ticks_per_frame = 10
+    frame_delay_ms = 20
+    #the number of most recent ticks shown
+    window = 4000
 
     period = 400
     sin_offset = 0.75
@@ -130,78 +201,64 @@ if __name__ == "__main__":
     #and default values on things like excitation and neurotransmitters
     
     #set up the matplot plots
-    fig, axes = plt.subplots(5, 1)
+    fig, axes = plt.subplots(5, 1, sharex=True)
     fig.set_figheight(8)
     fig.set_figwidth(15)
 
-    axes[0].set_xlim(0, n_ticks)
     axes[0].set_ylim(0, 50)
     axes[0].set_ylabel("Excitation")
     excitation_line, = axes[0].plot([], [], lw=2)
     
-    axes[1].set_xlim(0, n_ticks)
     axes[1].set_ylim(0, Neuron.spike_charge*1.1)
     axes[1].set_ylabel("Charge")
     charges_line, = axes[1].plot([], [], lw=2)
     
-    axes[2].set_xlim(0, n_ticks)
     axes[2].set_ylim(0, Neuron.refractory_period*1.1)
     axes[2].set_ylabel("Refractory state")
     refractor_line, = axes[2].plot([], [], lw=2)
     
-    axes[3].set_xlim(0, n_ticks)
     axes[3].set_ylim(0, Neuron.available_neurotrans*1.1)
     axes[3].set_ylabel("Neurotransmitters")
     neurotrans_line, = axes[3].plot([], [], lw=2)
     
-    axes[4].set_xlim(0, n_ticks)
     axes[4].set_ylim(0, 1.1)
     axes[4].set_ylabel("Output")
     axes[4].set_xlabel("Time")
     output_line, = axes[4].plot([], [], lw=2)
 
-    #data logging
-    times = []
-    excitations = []
-    charges = []
-    refractor_states = []
-    neurotrans = []
-    outputs = []
+    #the plots only hold the last window ticks, and draw at most two points per pixel
+    lines = (excitation_line, charges_line, refractor_line, neurotrans_line, output_line)
+    plot = LivePlot(lines, window, resolution=int(fig.get_figwidth() * fig.dpi))
 
-    #set up the tick function
+    #set up the tick function. the input is generated a frame at a time, and is the same
+    #every run
     neuron = Neuron()
+    drive = PeriodicInput(neuron_input, period, sin_offset, seed=0)
+    samples = np.empty((ticks_per_frame, len(lines)))
+
+    #performs a frame's worth of ticks, then redraws the plots once
+    def do_frame(frame):
+        start = frame * ticks_per_frame
+        ticks = np.arange(start, start + ticks_per_frame)
+
+        inputs = drive.block(start, ticks_per_frame, 0, 1)[:, 0]
+        for i, input in enumerate(inputs):
+            #do a neuron timestep
+            neuron.step(input)
+
+            #store the neuron's internal state and output
+            samples[i] = (neuron.excitation, neuron.charge, neuron.refractory_state,
+                neuron.neurotrans, neuron.output())
+
+        plot.extend(ticks, samples)
+        print(ticks[-1], neuron, input)
+
+        return plot.update()
 
-    def do_tick(t):
-        #do a neuron timestep
-        input = neuron_input * random.random() * max(min(np.sin(t*np.pi*2 / period)+sin_offset, 1), 0)
-        print(neuron.step(input), neuron, input)
-
-        #store the neuron's internal state and output
-        times.append(t)
-        excitations.append(neuron.excitation)
-        charges.append(neuron.charge)
-        refractor_states.append(neuron.refractory_state)
-        neurotrans.append(neuron.neurotrans)
-        outputs.append(neuron.output())
-
-        #update the lines
-        excitation_line.set_data(times, excitations)
-        charges_line.set_data(times, charges)
-        refractor_line.set_data(times, refractor_states)
-        neurotrans_line.set_data(times, neurotrans)
-        output_line.set_data(times, outputs)
-
-        return excitation_line, charges_line, refractor_line, neurotrans_line, output_line,
-        
-
-
-    def init():
-        return excitation_line, charges_line, refractor_line, neurotrans_line, output_line,
-
-    anim = animation.FuncAnimation(fig, do_tick,
-                            init_func=init,
-                            frames = n_ticks,
-                            interval = tick_delay_ms,
-                            blit = True,
+    #the axes scroll as the run goes on, so the whole figure is redrawn rather than blitted
+    anim = animation.FuncAnimation(fig, do_frame,
+                            frames = n_ticks // ticks_per_frame,
+                            interval = frame_delay_ms,
+                            blit = False,
                             repeat = False)
     plt.show()
@@ -0,0 +1,221 @@
+import numpy as np
+
+#spike timing dependent plasticity (stdp) of a network's synaptic weights. every neuron has a
+#presynaptic and a postsynaptic trace, which jump by 1 when it spikes and decay exponentially
+#in between. when a neuron spikes, its incoming synapses are strengthened by their source's
+#presynaptic trace (the source spiked shortly before), and its outgoing synapses are weakened
+#by their target's postsynaptic trace (the target spiked shortly before). only the synapses
+#of neurons that spiked are touched, so the cost is proportional to the number of spikes
+#rather than the number of synapses, like propagation. the traces are decayed lazily: each
+#neuron keeps the tick its traces were last updated, and they are only brought up to date
+#when read, so idle neurons cost nothing either
+#attach it to a network (see Network.plasticity) to apply it after every step
+class STDP:
+    #the names of the arrays saved in checkpoints (see arrays)
+    state_names = ("pre_trace", "post_trace", "trace_tick")
+    #the settings saved alongside them as the stdp_settings array, in this order, so a
+    #checkpoint can be resumed with the same rule (see from_arrays)
+    setting_names = ("a_plus", "a_minus", "tau_plus", "tau_minus", "w_min", "w_max")
+
+    #synapses: the Synapses whose weights are changed
+    #a_plus, a_minus: the largest strengthening and weakening from one pair of spikes
+    #tau_plus, tau_minus: the time constants in ticks of the presynaptic and postsynaptic
+    #traces, and so how far apart spikes can be and still change a weight
+    #w_min, w_max: the weights are kept within these bounds. they apply to every synapse, so
+    #lower w_min for networks with inhibitory (negative) weights
+    #state: optional dict of arrays to carry on from, i.e. a loaded checkpoint
+    def __init__(self, synapses, a_plus=0.1, a_minus=0.12, tau_plus=20, tau_minus=20,
+            w_min=0, w_max=10, state=None):
+        self.synapses = synapses
+        self.a_plus = a_plus
+        self.a_minus = a_minus
+        self.tau_plus = tau_plus
+        self.tau_minus = tau_minus
+        self.w_min = w_min
+        self.w_max = w_max
+
+        #the factor each trace decays by per tick, and tables of those factors to the power of
+        #each number of ticks, long enough that the last entry has underflowed to 0. looking
+        #the factors up is several times quicker than raising them to a power for every
+        #synapse, and gives the same values
+        self.pre_decay = np.exp(-1 / tau_plus)
+        self.post_decay = np.exp(-1 / tau_minus)
+        self.pre_table = self.pre_decay ** np.arange(int(750 * tau_plus) + 1)
+        self.post_table = self.post_decay ** np.arange(int(750 * tau_minus) + 1)
+
+        n = synapses.n_pre
+        if state is not None and "trace_tick" in state:
+            self.pre_trace = state["pre_trace"]
+            self.post_trace = state["post_trace"]
+            self.trace_tick = state["trace_tick"]
+        else:
+            self.pre_trace = np.zeros(n)
+            self.post_trace = np.zeros(n)
+            self.trace_tick = np.zeros(n, dtype=np.int64)
+
+        #the incoming index is built now rather than on the first spike, so the first tick
+        #isn't slow
+        synapses.build_incoming()
+
+        #synapses are built with read-only weights, which snapshots may still be using, so
+        #change a copy of them
+        if not synapses.weights.flags.writeable:
+            synapses.weights = synapses.weights.copy()
+
+    #returns the traces of neurons at tick
+    def pre_traces(self, neurons, tick):
+        return self.pre_trace[neurons] * self._decays(self.pre_table, neurons, tick)
+
+    def post_traces(self, neurons, tick):
+        return self.post_trace[neurons] * self._decays(self.post_table, neurons, tick)
+
+    #returns how much the traces of neurons have decayed since they were last updated
+    def _decays(self, table, neurons, tick):
+        ticks = np.minimum(tick - self.trace_tick[neurons], len(table) - 1)
+        return table[ticks]
+
+    #applies the rule for the neurons that spiked on tick
+    #spikes: array of spiking neuron indices
+    def update(self, tick, spikes):
+        if len(spikes) == 0:
+            return
+
+        #strengthen the synapses onto the spiking neurons, then weaken the ones out of them.
+        #the traces are read before this tick's spikes are added, so spikes on the same tick
+        #don't count as a pair
+        incoming, sources = self.synapses.incoming(spikes)
+        self._change(incoming, self.a_plus * self.pre_traces(sources, tick))
+
+        outgoing = self.synapses.outgoing(spikes)
+        targets = self.synapses.targets[outgoing]
+        self._change(outgoing, -self.a_minus * self.post_traces(targets, tick))
+
+        #bring the spiking neurons' traces up to date and add their spikes
+        self.pre_trace[spikes] = self.pre_traces(spikes, tick) + 1
+        self.post_trace[spikes] = self.post_traces(spikes, tick) + 1
+        self.trace_tick[spikes] = tick
+
+    #adds changes to the weights of synapses, keeping them within bounds. each synapse may
+    #only appear once
+    def _change(self, synapses, changes):
+        changes += self.synapses.weights[synapses]
+        np.clip(changes, self.w_min, self.w_max, out=changes)
+        self.synapses.weights[synapses] = changes
+
+    #rebuilds the rule saved in arrays by arrays(), i.e. a loaded checkpoint, carrying on
+    #from its traces
+    @classmethod
+    def from_arrays(cls, synapses, arrays):
+        settings = dict(zip(STDP.setting_names, arrays["stdp_settings"].tolist()))
+        return cls(synapses, state=arrays, **settings)
+
+    #returns the traces and settings as a dict of named arrays, i.e. to add to Network.arrays
+    def arrays(self):
+        arrays = {name : getattr(self, name) for name in STDP.state_names}
+        arrays["stdp_settings"] = np.array([getattr(self, name) for name in STDP.setting_names],
+            dtype=np.float64)
+        return arrays
+
+if __name__ == "__main__":
+    import time
+
+    from inputs import UniformInput
+    from network import Network
+    from profiling import PhaseTimer, format_summary
+
+    #test settings
+    n_small = 200
+    n_neurons = 100_000
+    n_ticks = 500
+
+    #check against a dense sweep of every synapse every tick, with the traces decayed every
+    #tick, on the spikes the network actually produced
+    network = Network.random(n_small, 10, 0, 6, seed=0)
+    initial = network.synapses.weights.copy()
+    network.plasticity = STDP(network.synapses)
+    source = UniformInput(4, seed=1)
+    spike_trains = [network.step(source(t, 0, n_small)) for t in range(n_ticks)]
+
+    stdp = network.plasticity
+    weights = initial.copy()
+    pre = np.repeat(np.arange(n_small), np.diff(network.synapses.indptr))
+    post = network.synapses.targets
+    pre_trace = np.zeros(n_small)
+    post_trace = np.zeros(n_small)
+    for spikes in spike_trains:
+        spiking = np.zeros(n_small, dtype=bool)
+        spiking[spikes] = True
+        pre_trace *= stdp.pre_decay
+        post_trace *= stdp.post_decay
+
+        weights = np.clip(weights + stdp.a_plus * pre_trace[pre] * spiking[post],
+            stdp.w_min, stdp.w_max)
+        weights = np.clip(weights - stdp.a_minus * post_trace[post] * spiking[pre],
+            stdp.w_min, stdp.w_max)
+        pre_trace += spiking
+        post_trace += spiking
+
+    assert np.allclose(weights, network.synapses.weights)
+    assert not np.array_equal(weights, initial)
+    n_spikes = sum(len(spikes) for spikes in spike_trains)
+    print(f"stdp matches a dense sweep over {n_ticks} ticks and {n_spikes} spikes, "
+        f"{np.count_nonzero(weights != initial)} of {len(weights)} weights changed")
+
+    #the rule must survive a checkpoint, carrying on from its traces, and a copy made with
+    #astype must learn on its own
+    resumed = Network.from_arrays({name : np.copy(values)
+        for name, values in network.arrays().items()})
+    copied = network.astype(np.float64)
+    assert resumed.plasticity.tau_minus == stdp.tau_minus
+    for t in range(n_ticks, n_ticks + 200):
+        external = source(t, 0, n_small)
+        spikes = network.step(external)
+        assert np.array_equal(spikes, resumed.step(external)), f"tick {t}"
+        assert np.array_equal(spikes, copied.step(external)), f"tick {t}"
+    assert np.array_equal(network.synapses.weights, resumed.synapses.weights)
+    assert np.array_equal(network.synapses.weights, copied.synapses.weights)
+    assert copied.plasticity.pre_trace is not network.plasticity.pre_trace
+    print("stdp carries on exactly from a checkpoint")
+
+    #batches and sharded networks step without plasticity, so they must refuse it
+    from batch import NetworkBatch
+    from sharding import ShardedNetwork
+    for wrap in (lambda n: NetworkBatch([n]), lambda n: ShardedNetwork(n, 1)):
+        try:
+            wrap(network)
+            raise AssertionError("networks with plasticity should be refused")
+        except ValueError as e:
+            print(f"expected error: {e}")
+
+    #the share of tick time plasticity takes on a large network
+    network = Network.random(n_neurons, 10, 0, 6, seed=0)
+    network.plasticity = STDP(network.synapses)
+    timer = PhaseTimer(enabled=True)
+    network.timer = timer
+    source = UniformInput(4, seed=1)
+    for t in range(n_ticks):
+        timer.start_tick()
+        external = source(t, 0, n_neurons)
+        timer.mark("input")
+        spikes = network.step(external)
+        timer.count_spikes(len(spikes), n_neurons)
+        timer.end_tick()
+
+    summary = timer.summary()
+    share = summary["phases_ms"]["plasticity"] / sum(summary["phases_ms"].values())
+    print(format_summary(summary))
+    print(f"plasticity takes {share:.1%} of tick time")
+
+    #what a dense sweep of every weight costs per tick, for comparison
+    synapses = network.synapses
+    pre = np.repeat(np.arange(n_neurons), np.diff(synapses.indptr))
+    spiking = np.zeros(n_neurons, dtype=bool)
+    spiking[spikes] = True
+    stdp = network.plasticity
+    start = time.perf_counter()
+    for _ in range(10):
+        np.clip(synapses.weights + stdp.a_plus * stdp.pre_trace[pre] * spiking[synapses.targets]
+            - stdp.a_minus * stdp.post_trace[synapses.targets] * spiking[pre], 0, 10)
+    sweep_time = (time.perf_counter() - start) / 10
+    print(f"plasticity: {summary['phases_ms']['plasticity']:.3f}ms/tick, "
+        f"dense sweep: {sweep_time*1e3:.3f}ms/tick")
@@ -0,0 +1,309 @@
+import types
+
+import numpy as np
+
+from neuron import Neuron, NeuronParameters
+
+#performs one timestep in place on arrays of neuron state, with the same dynamics as
+#Neuron.step. every branch is replaced by a mask, so this mirrors it line for line, and the
+#order of floating point operations is kept identical so the results match
+#params: the settings to use, with either a single value or an array of per-neuron values
+#for each setting
+#spiking, mask: boolean scratch arrays the same size as the state
+def _step(excitation, charge, refractory_state, neurotrans, swi, params, spiking, mask):
+    #update excitation
+    excitation -= params.excitation_decay
+    excitation += swi
+
+    #are we spiking? apply neurotransmitter cost, proportional to output strength (1)
+    np.greater(charge, 0, out=spiking)
+    np.copyto(neurotrans, np.maximum(neurotrans - params.spike_cost_coeff, 0), where=spiking)
+
+    #end the spike if we run out of neurotransmitters
+    np.equal(neurotrans, 0, out=mask)
+    mask &= spiking
+    charge[mask] = 0
+
+    #apply charge decay, but ensure charge never drops below zero
+    np.copyto(charge, np.maximum(charge - params.charge_decay, 0), where=spiking)
+
+    #apply refractory state decay, but ensure refractory_state never drops below zero
+    np.greater(refractory_state, 0, out=mask)
+    np.copyto(refractory_state, np.maximum(refractory_state - params.refractory_decay, 0),
+        where=mask)
+
+    #update neurotransmitters
+    neurotrans += params.reuptake_coeff * (params.available_neurotrans - neurotrans)
+
+    #check for spike threshold. only spike if we're not in a refractory state and have
+    #enough neurotransmitters
+    np.greater(excitation, params.spike_threshold, out=mask)
+    mask &= refractory_state == 0
+    mask &= neurotrans >= params.neurotrans_threshold
+
+    #start a spike, reset excitation and enter a refractory state
+    np.copyto(charge, params.spike_charge, where=mask)
+    excitation[mask] = 0
+    np.copyto(refractory_state, params.refractory_period, where=mask)
+
+#a population of neurons stored as contiguous arrays, one element per neuron. steps every
+#neuron at once with the same dynamics as Neuron.step, without any per-neuron python calls
+class NeuronPopulation:
+    #names of the per-neuron state arrays, in the same order as Neuron.__str__
+    state_names = ("excitation", "charge", "refractory_state", "neurotrans")
+
+    #sets up the state arrays for size neurons, all in the same state as a new Neuron
+    #params: the settings every neuron uses (see NeuronParameters), or a list of settings for
+    #a heterogeneous population. defaults to the Neuron class variables
+    #param_index: when params is a list, the index into it of each neuron's settings
+    #dtype: the type of the state arrays. float32 halves the memory and bandwidth of the
+    #state; see precision.py for how much it changes the results of a given network
+    #state: optional dict of existing arrays to use as the state instead of new ones, i.e.
+    #views into shared memory. the arrays are used directly, not copied
+    def __init__(self, size, params=None, param_index=None, dtype=np.float64, state=None):
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self._set_parameters(params, param_index)
+
+        if state is None:
+            self.excitation = np.zeros(size, dtype=self.dtype)
+            self.charge = np.zeros(size, dtype=self.dtype)
+            self.refractory_state = np.zeros(size, dtype=self.dtype)
+            self.neurotrans = np.empty(size, dtype=self.dtype)
+            self.neurotrans[:] = self._parameters().available_neurotrans
+        else:
+            for name in NeuronPopulation.state_names:
+                if state[name].shape != (size,) or state[name].dtype != self.dtype:
+                    raise ValueError(f"{name} must be a {self.dtype} array of {size} entries")
+                setattr(self, name, state[name])
+
+        #scratch masks reused every step to avoid allocating
+        self._spiking = np.empty(size, dtype=bool)
+        self._mask = np.empty(size, dtype=bool)
+
+    #builds a heterogeneous population from consecutive groups of neurons
+    #groups: list of (number of neurons, settings) pairs
+    @classmethod
+    def from_groups(cls, groups, dtype=np.float64):
+        counts = [count for count, _ in groups]
+        param_index = np.repeat(np.arange(len(groups)), counts)
+
+        return cls(sum(counts), [params for _, params in groups], param_index, dtype)
+
+    #stores the settings. a heterogeneous population keeps one table entry per distinct set of
+    #settings plus a small index per neuron, and only the settings that actually differ
+    #between sets are looked up per neuron each step
+    def _set_parameters(self, params, param_index):
+        self.params = Neuron if params is None else params
+        self.param_index = None
+
+        if param_index is None:
+            if isinstance(self.params, (list, tuple)):
+                raise ValueError("param_index is required when params is a list")
+            return
+
+        if not isinstance(self.params, (list, tuple)):
+            raise ValueError("params must be a list of settings when param_index is given")
+        if len(param_index) != self.size:
+            raise ValueError(f"param_index must have {self.size} entries")
+
+        #the smallest index type that fits keeps the per-neuron cost to a byte or two
+        index_type = np.min_scalar_type(max(len(self.params) - 1, 0))
+        self.param_index = np.asarray(param_index).astype(index_type)
+
+        #the settings are stored as python floats or in the state's type, so that stepping
+        #reduced precision state never promotes it to float64
+        self._constant = {}
+        self._varying = {}
+        for name in Neuron.parameter_names:
+            values = np.array([getattr(p, name) for p in self.params], dtype=np.float64)
+            if np.all(values == values[0]):
+                self._constant[name] = float(values[0])
+            else:
+                self._varying[name] = values.astype(self.dtype)
+
+    #returns the settings of every neuron (or the neurons at index), as an object with an
+    #attribute for each setting holding either a single value or an array of values
+    def _parameters(self, index=None):
+        if self.param_index is None:
+            return self.params
+
+        param_index = self.param_index if index is None else self.param_index[index]
+        settings = dict(self._constant)
+        for name, values in self._varying.items():
+            settings[name] = values[param_index]
+
+        return types.SimpleNamespace(**settings)
+
+    #performs one timestep for every neuron in the population
+    #swi: array (or scalar) of the sums of each neuron's weighted inputs
+    #returns the boolean output spike vector after the step
+    def step(self, swi):
+        _step(self.excitation, self.charge, self.refractory_state, self.neurotrans, swi,
+            self._parameters(), self._spiking, self._mask)
+
+        return self.output()
+
+    #performs one timestep for only the neurons at index, leaving every other neuron untouched
+    #index: array of neuron indices
+    #swi: array of the sums of weighted inputs of the neurons at index
+    #returns the boolean output spike vector of the neurons at index after the step
+    def step_subset(self, index, swi):
+        state = [getattr(self, name)[index] for name in NeuronPopulation.state_names]
+        _step(*state, swi, self._parameters(index), np.empty(len(index), dtype=bool),
+            np.empty(len(index), dtype=bool))
+
+        for name, values in zip(NeuronPopulation.state_names, state):
+            getattr(self, name)[index] = values
+
+        return state[1] > 0
+
+    #returns true for every neuron (at index, if given) that can never spike again without
+    #input: it isn't spiking and excitation, which only decays without input, is at or below
+    #the spike threshold. a dormant neuron's evolution has a closed form (see decay)
+    def dormant(self, index=None):
+        params = self._parameters(index)
+        if index is None:
+            return (self.charge == 0) & (self.excitation <= params.spike_threshold)
+        return (self.charge[index] == 0) & (self.excitation[index] <= params.spike_threshold)
+
+    #applies k ticks without input to the dormant neurons at index in closed form, matching
+    #k calls to step within float tolerance
+    #index: array of dormant neuron indices
+    #k: number of ticks to apply, either one for all neurons or an array matching index
+    def decay(self, index, k):
+        params = self._parameters(index)
+
+        #excitation and refractory_state decay linearly, with refractory_state stopping at zero
+        self.excitation[index] -= k * params.excitation_decay
+        self.refractory_state[index] = np.maximum(
+            self.refractory_state[index] - k * params.refractory_decay, 0)
+
+        #the distance to the baseline neurotransmitter level shrinks geometrically
+        remaining = (1 - params.reuptake_coeff) ** np.asarray(k, dtype=self.dtype)
+        self.neurotrans[index] = params.available_neurotrans \
+            - (params.available_neurotrans - self.neurotrans[index]) * remaining
+
+    #performs k timesteps without input for every neuron (or the neurons at index), like
+    #Neuron.advance. neurons that aren't dormant are stepped until they are, and the rest of
+    #the ticks are applied at once in closed form (see decay)
+    #returns the boolean output spike vector of the neurons after advancing
+    def advance(self, k, index=None):
+        index = np.arange(self.size) if index is None else np.asarray(index)
+        remaining = np.full(len(index), k, dtype=np.int64)
+
+        #step the active neurons, dropping each one as soon as it settles. this rarely takes
+        #more than a few ticks, as the neurons only decay
+        active = np.flatnonzero(~self.dormant(index))
+        for _ in range(k):
+            if len(active) == 0:
+                break
+
+            self.step_subset(index[active], np.zeros(len(active), dtype=self.dtype))
+            remaining[active] -= 1
+            active = active[~self.dormant(index[active])]
+
+        idle = remaining > 0
+        self.decay(index[idle], remaining[idle])
+
+        return self.charge[index] > 0
+
+    #returns the output state of every neuron at the current internal state
+    def output(self):
+        return self.charge > 0
+
+    #returns the number of neurons in the population
+    def __len__(self):
+        return self.size
+
+    #returns a string representation of neuron i's internal state, matching Neuron.__str__
+    def neuron_str(self, i):
+        return ", ".join(f"{getattr(self, name)[i]:.3f}" for name in NeuronPopulation.state_names)
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    #test settings
+    n_neurons = 1000
+    n_ticks = 2000
+
+    #drive a population and the same number of scalar neurons with identical random input
+    random.seed(0)
+    inputs = [[4 * random.random() for _ in range(n_neurons)] for _ in range(n_ticks)]
+
+    neurons = [Neuron() for _ in range(n_neurons)]
+    population = NeuronPopulation(n_neurons)
+
+    max_error = 0
+    for t in range(n_ticks):
+        scalar_out = [n.step(x) for n, x in zip(neurons, inputs[t])]
+        vector_out = population.step(np.array(inputs[t]))
+
+        #outputs must match exactly, state to within float tolerance
+        assert np.array_equal(np.array(scalar_out, dtype=bool), vector_out), f"tick {t}"
+        for name in NeuronPopulation.state_names:
+            scalar_state = np.array([getattr(n, name) for n in neurons])
+            max_error = max(max_error, np.max(np.abs(scalar_state - getattr(population, name))))
+
+    print(f"{n_ticks} ticks of {n_neurons} neurons match, max state error {max_error}")
+
+    #a heterogeneous population must match scalar neurons using the same settings
+    fast = NeuronParameters(excitation_decay=0.5, refractory_period=2, spike_threshold=12)
+    slow = NeuronParameters(reuptake_coeff=0.002, spike_cost_coeff=4)
+    groups = [(n_neurons // 2, fast), (n_neurons // 4, slow), (n_neurons // 4, Neuron)]
+
+    neurons = [Neuron(params) for count, params in groups for _ in range(count)]
+    population = NeuronPopulation.from_groups(groups)
+
+    for t in range(n_ticks):
+        scalar_out = [n.step(x) for n, x in zip(neurons, inputs[t])]
+        vector_out = population.step(np.array(inputs[t]))
+        assert np.array_equal(np.array(scalar_out, dtype=bool), vector_out), f"tick {t}"
+
+    print(f"heterogeneous population of {len(groups)} neuron types matches, "
+        f"{population.param_index.nbytes} bytes of per-neuron settings")
+
+    #advancing without input must match stepping with zero input, including neurons that
+    #are still spiking or above threshold when the input stops
+    n_idle = 500
+    population = NeuronPopulation.from_groups(groups)
+    population.step(np.array(inputs[0]) * 10)
+    stepped = NeuronPopulation.from_groups(groups)
+    for name in NeuronPopulation.state_names:
+        getattr(stepped, name)[:] = getattr(population, name)
+    neuron = Neuron(fast)
+    neuron.step(30)
+    stepped_neuron = Neuron(fast)
+    stepped_neuron.step(30)
+
+    start = time.perf_counter()
+    population.advance(n_idle)
+    advance_time = time.perf_counter() - start
+    neuron.advance(n_idle)
+
+    start = time.perf_counter()
+    for _ in range(n_idle):
+        stepped.step(0)
+        stepped_neuron.step(0)
+    step_time = time.perf_counter() - start
+
+    for name in NeuronPopulation.state_names:
+        assert np.allclose(getattr(population, name), getattr(stepped, name))
+        assert np.isclose(getattr(neuron, name), getattr(stepped_neuron, name))
+
+    print(f"advancing {n_idle} idle ticks matches stepping: {advance_time*1e3:.3f}ms, "
+        f"stepping: {step_time*1e3:.3f}ms")
+
+    #rough throughput comparison
+    swi = np.array(inputs[0])
+    start = time.perf_counter()
+    for n, x in zip(neurons, inputs[0]):
+        n.step(x)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    population.step(swi)
+    vector_time = time.perf_counter() - start
+
+    print(f"scalar step: {scalar_time*1e3:.3f}ms, population step: {vector_time*1e3:.3f}ms")
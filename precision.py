@@ -0,0 +1,115 @@
+import numpy as np
+
+from population import NeuronPopulation
+
+#returns the (tick, neuron) spike events of a network over n_ticks ticks, as one sorted key
+#per event (neuron * stride + tick), so events can be matched by neuron and time at once
+def _spike_keys(network, n_ticks, stride, input_fn):
+    keys = []
+    size = len(network)
+    for t in range(n_ticks):
+        external = None if input_fn is None else input_fn(t, 0, size)
+        keys.append(network.step(external).astype(np.int64) * stride + t)
+
+    return np.sort(np.concatenate(keys))
+
+#returns how many of the events in keys have an event in reference_keys for the same neuron
+#within window ticks either side
+def _matched(keys, reference_keys, window):
+    #the first reference event at or after each event's window starts, and whether it's
+    #still inside the window. the key stride leaves a gap of more than window between
+    #neurons, so a window never reaches another neuron's events
+    first = np.searchsorted(reference_keys, keys - window)
+    inside = first < len(reference_keys)
+    inside[inside] = reference_keys[first[inside]] <= keys[inside] + window
+
+    return np.count_nonzero(inside)
+
+#runs a network and a copy of it converted to dtype side by side with the same input, and
+#reports how far the reduced precision copy's spikes drift from the original's
+#network: the reference network. it is stepped, so pass a copy to keep the original
+#input_fn: optional function (tick, lo, hi) returning the external input of neurons lo to hi
+#on the given tick, as for ShardedNetwork. the same float64 input is given to both networks
+#window: the number of ticks a spike may move by and still count as matched
+#returns a dict of:
+#   first_divergence: the first tick on which the spikes differ, or None
+#   spikes, candidate_spikes: the total spikes of the reference and the candidate
+#   matched_exact: the fraction of spikes that happen on the same tick in both
+#   matched_window: the fraction of spikes with a spike of the same neuron in the other
+#   network within window ticks, averaged over both networks
+#   rate_error: the relative difference in total spike count
+#   state_error: the largest difference in each state variable at the end
+def compare(network, dtype=np.float32, n_ticks=1000, input_fn=None, window=2):
+    candidate = network.astype(dtype)
+
+    stride = n_ticks + 2 * window + 1
+    reference_keys = _spike_keys(network, n_ticks, stride, input_fn)
+    candidate_keys = _spike_keys(candidate, n_ticks, stride, input_fn)
+
+    #the first divergence is the earliest tick of any event only one of them has
+    only_one = np.setxor1d(reference_keys, candidate_keys, assume_unique=True)
+    first_divergence = None if len(only_one) == 0 else int(np.min(only_one % stride))
+
+    exact = len(np.intersect1d(reference_keys, candidate_keys, assume_unique=True))
+    total = max(len(reference_keys) + len(candidate_keys), 1)
+    windowed = _matched(reference_keys, candidate_keys, window) \
+        + _matched(candidate_keys, reference_keys, window)
+
+    network.sync()
+    candidate.sync()
+    state_error = {
+        name : float(np.max(np.abs(getattr(network.population, name)
+            - getattr(candidate.population, name).astype(np.float64))))
+        for name in NeuronPopulation.state_names
+    }
+
+    return {
+        "first_divergence" : first_divergence,
+        "spikes" : len(reference_keys),
+        "candidate_spikes" : len(candidate_keys),
+        "matched_exact" : 2 * exact / total,
+        "matched_window" : float(windowed / total),
+        "rate_error" : (len(candidate_keys) - len(reference_keys)) / max(len(reference_keys), 1),
+        "state_error" : state_error
+    }
+
+#prints a report returned by compare
+def report(results, dtype=np.float32, window=2):
+    print(f"{np.dtype(dtype).name} against float64:")
+    divergence = results["first_divergence"]
+    print("    first divergence: " + ("none" if divergence is None else f"tick {divergence}"))
+    print(f"    spikes: {results['spikes']} vs {results['candidate_spikes']} "
+        f"({results['rate_error']:+.3%})")
+    print(f"    spikes on the same tick: {results['matched_exact']:.3%}, "
+        f"within {window} ticks: {results['matched_window']:.3%}")
+    for name, error in results["state_error"].items():
+        print(f"    max {name} error: {error:.3g}")
+
+if __name__ == "__main__":
+    import argparse
+
+    from inputs import UniformInput
+    from network import Network
+
+    parser = argparse.ArgumentParser(
+        description="Reports how much a random network's spikes change at reduced precision")
+    parser.add_argument("--neurons", type=int, default=100_000)
+    parser.add_argument("--fan-out", type=int, default=10)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=2)
+    args = parser.parse_args()
+
+    #seeded noisy drive, so both networks get the same input
+    input_fn = UniformInput(4, seed=12345)
+
+    network = Network.random(args.neurons, args.fan_out, 0, 6, seed=0)
+    results = compare(network, np.float32, args.ticks, input_fn, args.window)
+    report(results, np.float32, args.window)
+
+    reduced = network.astype(np.float32)
+    def network_bytes(n):
+        arrays = n.arrays()
+        return sum(arrays[name].nbytes
+            for name in NeuronPopulation.state_names + ("weights",))
+    print(f"    state and weights: {network_bytes(network) / 2**20:.1f}MiB vs "
+        f"{network_bytes(reduced) / 2**20:.1f}MiB")
@@ -0,0 +1,148 @@
+import time
+
+#accumulates how long each phase of a tick takes (i.e. input, propagation, update,
+#recording, saving), along with spike counts, and summarises them periodically. a tick is
+#timed by calling start_tick, then mark at the end of each phase, then end_tick. each mark
+#costs one clock read and a dict update, and nothing at all while disabled, so it is cheap
+#enough to leave in the hot path and switch on while the simulation runs. spike counts are
+#also kept as running totals, enabled or not, for live metrics (see Simulation.metrics)
+class PhaseTimer:
+    #enabled: whether to record anything. can be changed at any time; a tick that is already
+    #under way when it's switched on is skipped
+    #summary_interval: the number of seconds between summaries (see summary_due), or None
+    #for no periodic summaries
+    def __init__(self, enabled=False, summary_interval=10):
+        self.enabled = enabled
+        self.summary_interval = summary_interval
+        self.reset()
+
+        #running totals since the timer was made, which reset doesn't clear, and the counts
+        #of the latest tick
+        self.total_spikes = 0
+        self.total_neuron_ticks = 0
+        self.tick_spikes = 0
+        self.tick_neurons = 0
+
+    #clears everything recorded so far and starts a new summary window
+    def reset(self):
+        #total seconds spent in each phase
+        self.phases = {}
+        self.ticks = 0
+        self.spikes = 0
+        self.neuron_ticks = 0
+        self.worst_tick = 0.0
+
+        self.window_start = time.perf_counter()
+        self.tick_start = None
+        self.last_mark = None
+
+    #starts timing a tick
+    def start_tick(self):
+        if self.enabled:
+            self.tick_start = self.last_mark = time.perf_counter()
+        else:
+            self.tick_start = self.last_mark = None
+
+    #ends a phase, adding the time since the previous mark (or the start of the tick) to it
+    def mark(self, phase):
+        if self.last_mark is None:
+            return
+
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last_mark
+        self.last_mark = now
+
+    #counts the spikes of a tick
+    #n_neurons: the number of neurons that could have spiked, for the firing rate
+    def count_spikes(self, n_spikes, n_neurons):
+        self.total_spikes += n_spikes
+        self.total_neuron_ticks += n_neurons
+        self.tick_spikes = n_spikes
+        self.tick_neurons = n_neurons
+
+        if self.last_mark is None:
+            return
+
+        self.spikes += n_spikes
+        self.neuron_ticks += n_neurons
+
+    #ends the tick. any time since the last mark is added to phase
+    def end_tick(self, phase="other"):
+        if self.last_mark is None:
+            return
+
+        self.mark(phase)
+        self.ticks += 1
+        self.worst_tick = max(self.worst_tick, self.last_mark - self.tick_start)
+        self.tick_start = self.last_mark = None
+
+    #returns true if enabled and summary_interval has passed since the last summary
+    def summary_due(self):
+        return self.enabled and self.summary_interval is not None \
+            and time.perf_counter() - self.window_start >= self.summary_interval
+
+    #returns a summary of the ticks recorded since the last summary, and starts a new window.
+    #times are in milliseconds per tick
+    def summary(self):
+        elapsed = time.perf_counter() - self.window_start
+        ticks = max(self.ticks, 1)
+
+        summary = {
+            "ticks" : self.ticks,
+            "ticks_per_sec" : self.ticks / elapsed if elapsed > 0 else 0.0,
+            "spikes_per_tick" : self.spikes / ticks,
+            "firing_rate" : self.spikes / self.neuron_ticks if self.neuron_ticks else 0.0,
+            "phases_ms" : {name : total / ticks * 1e3 for name, total in self.phases.items()},
+            "worst_tick_ms" : self.worst_tick * 1e3
+        }
+
+        self.reset()
+        return summary
+
+#returns a summary from PhaseTimer.summary as one line of text
+def format_summary(summary):
+    phases = ", ".join(f"{name} {ms:.3f}ms" for name, ms in summary["phases_ms"].items())
+    return (f"{summary['ticks']} ticks at {summary['ticks_per_sec']:.1f} ticks/sec, "
+        f"{summary['spikes_per_tick']:.1f} spikes/tick ({summary['firing_rate']:.2%} firing). "
+        f"per tick: {phases}. worst tick {summary['worst_tick_ms']:.3f}ms")
+
+if __name__ == "__main__":
+    import numpy as np
+
+    from network import Network
+
+    #test settings
+    n_neurons = 100_000
+    n_ticks = 300
+    n_rounds = 5
+
+    network = Network.random(n_neurons, 10, 0, 6, seed=0)
+    rng = np.random.default_rng(1)
+    timer = PhaseTimer()
+    network.timer = timer
+
+    def run(enabled):
+        timer.enabled = enabled
+        start = time.perf_counter()
+        for _ in range(n_ticks):
+            timer.start_tick()
+            external = 4 * rng.random(n_neurons)
+            timer.mark("input")
+            spikes = network.step(external)
+            timer.count_spikes(len(spikes), n_neurons)
+            timer.end_tick()
+        return time.perf_counter() - start
+
+    #alternate the two, taking the best of each, so background noise affects both alike
+    disabled_time = enabled_time = float("inf")
+    for _ in range(n_rounds):
+        disabled_time = min(disabled_time, run(False))
+        enabled_time = min(enabled_time, run(True))
+
+    summary = timer.summary()
+    assert summary["ticks"] == n_ticks * n_rounds
+    assert timer.total_neuron_ticks == 2 * n_ticks * n_rounds * n_neurons
+    assert set(summary["phases_ms"]) == {"input", "propagation", "update", "other"}
+
+    print(format_summary(summary))
+    print(f"instrumentation overhead: {enabled_time / disabled_time - 1:.2%}")
@@ -0,0 +1,286 @@
+import pathlib
+import queue
+import threading
+
+import numpy as np
+
+#the record type of a spike event
+spike_dtype = np.dtype([("tick", np.int64), ("neuron", np.int32)])
+
+#writes numbered chunk files (name-000000.npy, name-000001.npy, ...) into a directory on a
+#background thread, so the simulation thread never waits on the disk. at most max_pending
+#chunks are queued, so a disk that can't keep up either holds up the writes (backpressure)
+#or has chunks dropped, rather than the queue growing without bound. if writing fails, the
+#error is raised from close, and every later chunk is dropped
+class ChunkWriter:
+    #directory: the directory to write to. created if it doesn't exist
+    #name: the prefix of every chunk file
+    #max_pending: the number of chunks that can be queued before the writer is behind
+    #block: whether write waits for room when the writer is behind. otherwise the chunk is
+    #dropped and counted in dropped. its number is still used, so the gap shows in the files
+    def __init__(self, directory, name, max_pending=16, block=True):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self.block = block
+        self.n_chunks = 0
+
+        #the number of chunks not written, either because the queue was full or because
+        #writing failed, and the first error writing raised. both threads count drops
+        self.dropped = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self.thread.start()
+
+    #queues a chunk to be written. the writer takes ownership of the array
+    def write(self, chunk):
+        try:
+            self.queue.put((self.n_chunks, chunk), block=self.block)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+        self.n_chunks += 1
+
+    #waits for every queued chunk to be written and stops the writer thread. raises the
+    #error writing failed with, if it did
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    #the target function of the writer thread. after a failure it keeps taking chunks off
+    #the queue, so that write and close never wait on a writer that has stopped
+    def _write_chunks(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            index, chunk = item
+            if self.error is None:
+                try:
+                    np.save(self.directory / f"{self.name}-{index:06d}.npy", chunk,
+                        allow_pickle=False)
+                    continue
+                except Exception as e:
+                    self.error = e
+
+            with self.lock:
+                self.dropped += 1
+
+#returns every chunk written by a ChunkWriter concatenated in order
+def read_chunks(directory, name):
+    files = sorted(pathlib.Path(directory).glob(f"{name}-*.npy"))
+    if not files:
+        return None
+
+    return np.concatenate([np.load(f, allow_pickle=False) for f in files])
+
+#a fixed size ring buffer of records. once full, each new record replaces the oldest, so
+#memory use never grows however long the simulation runs. records can also be streamed to
+#disk in chunks as they are added
+class RingBuffer:
+    #capacity: the number of records held in memory
+    #dtype: the type of each record
+    #stream: optional ChunkWriter that receives every record, chunk_size records at a time
+    def __init__(self, capacity, dtype, stream=None, chunk_size=None):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+
+        #the total number of records ever added, and how many of those have been streamed
+        self.count = 0
+        self.streamed = 0
+
+        self.stream = stream
+        self.chunk_size = min(chunk_size or capacity, capacity)
+
+    #adds an array of records, streaming full chunks to disk
+    def extend(self, records):
+        #stream everything still unstreamed before it would be overwritten
+        if self.stream is not None and self.count + len(records) - self.streamed > self.capacity:
+            self.flush()
+
+        #a batch bigger than the whole buffer only leaves its newest records
+        if len(records) > self.capacity:
+            if self.stream is not None:
+                self.stream.write(records[:-self.capacity].copy())
+                self.streamed += len(records) - self.capacity
+            self.count += len(records) - self.capacity
+            records = records[-self.capacity:]
+
+        #write in at most two pieces, wrapping around the end of the buffer
+        start = self.count % self.capacity
+        first = min(len(records), self.capacity - start)
+        self.data[start:start + first] = records[:first]
+        self.data[:len(records) - first] = records[first:]
+        self.count += len(records)
+
+        while self.stream is not None and self.count - self.streamed >= self.chunk_size:
+            self._stream(self.chunk_size)
+
+    #streams every record not yet streamed, even if that's less than a full chunk
+    def flush(self):
+        if self.stream is not None and self.count > self.streamed:
+            self._stream(self.count - self.streamed)
+
+    #streams the oldest n unstreamed records
+    def _stream(self, n):
+        index = np.arange(self.streamed, self.streamed + n) % self.capacity
+        self.stream.write(self.data[index])
+        self.streamed += n
+
+    #returns the records held in memory, oldest first
+    def values(self):
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+
+        start = self.count % self.capacity
+        return np.concatenate((self.data[start:], self.data[:start]))
+
+#records output spikes as compact (tick, neuron) events
+class SpikeRecorder:
+    #capacity: the number of most recent spikes kept in memory
+    #directory: optional directory to stream every spike to, in chunks of chunk_size
+    def __init__(self, capacity, directory=None, chunk_size=None):
+        stream = None if directory is None else ChunkWriter(directory, "spikes")
+        self.buffer = RingBuffer(capacity, spike_dtype, stream=stream, chunk_size=chunk_size)
+
+    #records the neurons that spiked on a tick
+    #spikes: array of spiking neuron indices, i.e. as returned by Network.step
+    def record(self, tick, spikes):
+        if len(spikes) == 0:
+            return
+
+        events = np.empty(len(spikes), dtype=spike_dtype)
+        events["tick"] = tick
+        events["neuron"] = spikes
+        self.buffer.extend(events)
+
+    #returns the spikes held in memory as (ticks, neurons) arrays, oldest first
+    def spikes(self):
+        events = self.buffer.values()
+        return events["tick"], events["neuron"]
+
+    #returns the total number of spikes recorded
+    def __len__(self):
+        return self.buffer.count
+
+    #streams any remaining spikes and waits for them to be written
+    def close(self):
+        if self.buffer.stream is not None:
+            self.buffer.flush()
+            self.buffer.stream.close()
+
+#records samples of state variables of selected neurons
+class StateRecorder:
+    #neurons: array of the indices of the neurons to record
+    #variables: names of the state arrays to record (see NeuronPopulation.state_names)
+    #capacity: the number of most recent samples kept in memory
+    #interval: record a sample every interval ticks
+    #directory: optional directory to stream every sample to, in chunks of chunk_size
+    def __init__(self, neurons, variables, capacity, interval=1, directory=None,
+            chunk_size=None):
+        self.neurons = np.asarray(neurons)
+        self.variables = tuple(variables)
+        self.interval = interval
+
+        #each sample is its tick and a row per variable of the recorded neurons' values
+        sample_dtype = np.dtype([
+            ("tick", np.int64),
+            ("values", np.float64, (len(self.variables), len(self.neurons)))
+        ])
+        stream = None if directory is None else ChunkWriter(directory, "states")
+        self.buffer = RingBuffer(capacity, sample_dtype, stream=stream, chunk_size=chunk_size)
+        self.sample = np.empty(1, dtype=sample_dtype)
+
+    #records a sample if one is due on this tick
+    #network: the Network (or anything with population and sync) to sample
+    def record(self, tick, network):
+        if tick % self.interval != 0:
+            return
+
+        #event driven networks only update neurons when needed, so catch these ones up
+        network.sync(self.neurons)
+
+        self.sample["tick"] = tick
+        for i, name in enumerate(self.variables):
+            self.sample["values"][0, i] = getattr(network.population, name)[self.neurons]
+        self.buffer.extend(self.sample)
+
+    #returns the samples held in memory as (ticks, values) arrays, oldest first. values has
+    #shape (samples, variables, neurons)
+    def samples(self):
+        samples = self.buffer.values()
+        return samples["tick"], samples["values"]
+
+    #streams any remaining samples and waits for them to be written
+    def close(self):
+        if self.buffer.stream is not None:
+            self.buffer.flush()
+            self.buffer.stream.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from network import Network
+    from population import NeuronPopulation
+
+    #test settings
+    n_neurons = 100_000
+    n_ticks = 500
+
+    def run(record):
+        network = Network.random(n_neurons, 10, 0, 6, seed=0)
+        rng = np.random.default_rng(1)
+
+        start = time.perf_counter()
+        for _ in range(n_ticks):
+            spikes = network.step(4 * rng.random(n_neurons))
+            record(network, spikes)
+        return time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        spike_recorder = SpikeRecorder(1_000_000, directory, chunk_size=100_000)
+        state_recorder = StateRecorder(np.arange(0, n_neurons, 1000), NeuronPopulation.state_names,
+            capacity=200, interval=2, directory=directory, chunk_size=50)
+
+        #every spike should be recorded, streamed, and the last ones kept in memory
+        all_spikes = []
+        def record(network, spikes):
+            all_spikes.append(spikes)
+            spike_recorder.record(network.tick, spikes)
+            state_recorder.record(network.tick, network)
+
+        recording_time = run(record)
+        baseline_time = run(lambda network, spikes: None)
+        spike_recorder.close()
+        state_recorder.close()
+
+        streamed = read_chunks(directory, "spikes")
+        assert np.array_equal(streamed["neuron"], np.concatenate(all_spikes))
+        ticks, neurons = spike_recorder.spikes()
+        assert np.array_equal(neurons, streamed["neuron"][-len(neurons):])
+        assert np.array_equal(ticks, streamed["tick"][-len(ticks):])
+        assert len(read_chunks(directory, "states")) == n_ticks // 2
+
+        print(f"recorded {len(spike_recorder)} spikes, {len(neurons)} kept in memory")
+        print(f"recording overhead: {(recording_time / baseline_time - 1):.1%}")
+
+        #a failed write must not hold up later writes, however many there are, and must be
+        #raised from close
+        writer = ChunkWriter(directory, "failing", max_pending=1)
+        pathlib.Path(directory, "failing-000000.npy").mkdir()
+        for _ in range(10):
+            writer.write(np.zeros(10))
+        try:
+            writer.close()
+            raise AssertionError("close should raise the write error")
+        except OSError as e:
+            print(f"expected error: {type(e).__name__}, {writer.dropped} chunks dropped")
+        assert writer.dropped == 10
@@ -0,0 +1,318 @@
+import multiprocessing
+import multiprocessing.shared_memory as shared_memory
+import os
+import threading
+import traceback
+
+import numpy as np
+
+from population import NeuronPopulation
+
+#the body of each worker process. steps the neurons lo to hi (exclusive) in lockstep with
+#the other workers, exchanging spikes through shared memory once per tick
+#conn: pipe to the parent process, used for commands
+#barrier: barrier shared by all of the workers, passed once per tick
+#names: names of the state, spike and input shared memory blocks
+#synapses: the synapses onto this worker's neurons only (see Synapses.target_range)
+#input_fn: optional function (tick, lo, hi) returning the external input of neurons lo to hi
+def _worker(conn, barrier, names, size, lo, hi, params, param_index, synapses, input_fn):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    state, spikes, inputs = _arrays(blocks, size)
+
+    population = NeuronPopulation(hi - lo, params,
+        None if param_index is None else param_index[lo:hi],
+        state={name: values[lo:hi] for name, values in state.items()})
+
+    try:
+        while True:
+            command = conn.recv()
+            if command is None:
+                break
+
+            #spikes from tick t are written to spikes[t % 2], and read by every worker on
+            #tick t + 1. one barrier per tick is enough: nobody overwrites a buffer until
+            #everyone has finished reading it
+            start_tick, n_ticks, use_inputs = command
+            counts = np.zeros(n_ticks, dtype=np.int64)
+            for i in range(n_ticks):
+                tick = start_tick + i
+
+                swi = synapses.compute_swi(spikes[(tick - 1) % 2])
+                if use_inputs:
+                    swi += inputs[lo:hi]
+                elif input_fn is not None:
+                    swi += input_fn(tick, lo, hi)
+
+                output = population.step(swi)
+                spikes[tick % 2, lo:hi] = output
+                counts[i] = np.count_nonzero(output)
+
+                barrier.wait()
+
+            conn.send(counts)
+    except threading.BrokenBarrierError:
+        #another worker failed, and reports why itself
+        conn.send(_WorkerError(None))
+    except Exception:
+        #release the workers waiting on the barrier, and tell the parent what went wrong.
+        #the worker can't carry on in step with the others, so it stops
+        barrier.abort()
+        conn.send(_WorkerError(f"worker for neurons {lo} to {hi} failed:\n"
+            + traceback.format_exc()))
+
+    del state, spikes, inputs
+    for block in blocks:
+        block.close()
+
+#sent by a worker in place of its spike counts when it fails. message is None if it only
+#stopped because another worker failed
+class _WorkerError:
+    def __init__(self, message):
+        self.message = message
+
+#returns the state, spike and input arrays laid out over the shared memory blocks
+def _arrays(blocks, size):
+    state_block, spike_block, input_block = blocks
+
+    state_values = np.ndarray((len(NeuronPopulation.state_names), size), dtype=np.float64,
+        buffer=state_block.buf)
+    state = dict(zip(NeuronPopulation.state_names, state_values))
+    spikes = np.ndarray((2, size), dtype=bool, buffer=spike_block.buf)
+    inputs = np.ndarray(size, dtype=np.float64, buffer=input_block.buf)
+
+    return state, spikes, inputs
+
+#runs a Network split across several worker processes. each worker owns a contiguous range
+#of neurons and the synapses onto them, all neuron state lives in shared memory, and the
+#workers exchange spikes once per tick. results match stepping the network in one process
+class ShardedNetwork:
+    #network: the Network to run, without delays or plasticity. its state is copied into
+    #shared memory, so the original is left untouched
+    #n_workers: number of worker processes. defaults to the number of cores
+    #input_fn: optional function (tick, lo, hi) returning the external input of neurons lo to
+    #hi on the given tick. called inside the workers by run(), so it must be picklable and
+    #give the same result however the neurons are split (i.e. seeded by tick and neuron)
+    def __init__(self, network, n_workers=None, input_fn=None):
+        population = network.population
+        if population.dtype != np.float64:
+            raise ValueError("sharded networks require float64 state")
+        if network.queue is not None:
+            raise ValueError("sharded networks don't support synaptic delays")
+        if network.plasticity is not None:
+            raise ValueError("sharded networks don't support plasticity")
+
+        #event driven networks only update neurons when needed, so catch them all up first
+        network.sync()
+        self.size = len(population)
+        self.n_workers = min(n_workers or os.cpu_count(), self.size)
+        self.tick = network.tick
+
+        #lay out the state, the double buffered spike vector and an external input vector
+        #in shared memory
+        state_bytes = len(NeuronPopulation.state_names) * self.size * 8
+        self.blocks = [
+            shared_memory.SharedMemory(create=True, size=state_bytes),
+            shared_memory.SharedMemory(create=True, size=2 * self.size),
+            shared_memory.SharedMemory(create=True, size=self.size * 8)
+        ]
+        state, self.spikes, self.inputs = _arrays(self.blocks, self.size)
+
+        for name in NeuronPopulation.state_names:
+            state[name][:] = getattr(population, name)
+        self.spikes[(self.tick - 1) % 2] = population.output()
+
+        #a population over the shared state, for reading it from this process
+        self.population = NeuronPopulation(self.size, population.params,
+            population.param_index, state=state)
+
+        #split the neurons into equal contiguous ranges and start a worker for each
+        bounds = np.linspace(0, self.size, self.n_workers + 1).astype(int)
+        self.barrier = multiprocessing.Barrier(self.n_workers)
+        names = [block.name for block in self.blocks]
+
+        self.connections = []
+        self.workers = []
+        try:
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                parent_conn, child_conn = multiprocessing.Pipe()
+                worker = multiprocessing.Process(target=_worker, daemon=True, args=(
+                    child_conn, self.barrier, names, self.size, lo, hi, population.params,
+                    population.param_index, network.synapses.target_range(lo, hi), input_fn
+                ))
+                worker.start()
+                self.connections.append(parent_conn)
+                self.workers.append(worker)
+        except BaseException:
+            self.close()
+            raise
+
+    #closes the network on leaving a with block, so the shared memory is always freed
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #runs n_ticks ticks, with external input from input_fn
+    #returns the number of spikes on each tick
+    def run(self, n_ticks):
+        return self._run(n_ticks, False)
+
+    #performs one timestep of the network, like Network.step
+    #external: optional array (or scalar) of external input added to every neuron's swi
+    #returns the indices of the neurons that spiked
+    def step(self, external=None):
+        if external is None:
+            self._run(1, False)
+        else:
+            self.inputs[:] = external
+            self._run(1, True)
+
+        return np.flatnonzero(self.spikes[(self.tick - 1) % 2])
+
+    #sends a run command to every worker and waits for all of them to finish
+    #raises RuntimeError if a worker fails or dies. the network is closed first, as the
+    #workers are no longer in step
+    def _run(self, n_ticks, use_inputs):
+        if self.blocks is None:
+            raise RuntimeError("the sharded network has been closed")
+
+        for conn in self.connections:
+            try:
+                conn.send((self.tick, n_ticks, use_inputs))
+            except OSError:
+                #the worker has died, which _receive reports
+                pass
+
+        results = [self._receive(conn, worker)
+            for conn, worker in zip(self.connections, self.workers)]
+        errors = [result for result in results if isinstance(result, _WorkerError)]
+        if errors:
+            self.close()
+            messages = [error.message for error in errors if error.message is not None]
+            raise RuntimeError(messages[0] if messages else "a worker failed")
+
+        self.tick += n_ticks
+        return sum(results)
+
+    #waits for a worker's reply. if any worker dies, the barrier is broken so the others stop
+    #waiting for it, and an error is returned in place of a dead worker's reply
+    def _receive(self, conn, worker):
+        while not conn.poll(0.1):
+            if all(w.is_alive() for w in self.workers):
+                continue
+
+            self.barrier.abort()
+            #it may have replied just before exiting
+            if not worker.is_alive() and not conn.poll():
+                return _WorkerError(f"worker {worker.pid} died with exit code "
+                    f"{worker.exitcode}")
+
+        try:
+            return conn.recv()
+        except (EOFError, OSError):
+            self.barrier.abort()
+            worker.join(timeout=1)
+            return _WorkerError(f"worker {worker.pid} died with exit code {worker.exitcode}")
+
+    #stops the workers and frees the shared memory. the state can't be read afterwards. safe
+    #to call more than once, and after a worker has failed
+    def close(self):
+        if self.blocks is None:
+            return
+
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+        del self.population, self.spikes, self.inputs
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = None
+
+    #returns the number of neurons in the network
+    def __len__(self):
+        return self.size
+
+if __name__ == "__main__":
+    import time
+
+    from inputs import UniformInput
+    from network import Network
+
+    #test settings
+    n_neurons = 200_000
+    n_ticks = 200
+
+    #noisy drive generated by every worker for its own neurons, which is the same however the
+    #neurons are split between workers
+    example_input = UniformInput(4, seed=12345)
+
+    #the reference: the same network stepped in this process
+    reference = Network.random(n_neurons, 10, 0, 6, seed=0)
+    sharded = ShardedNetwork(reference, input_fn=example_input)
+
+    start = time.perf_counter()
+    reference_counts = np.zeros(n_ticks, dtype=np.int64)
+    for t in range(n_ticks):
+        reference_counts[t] = len(reference.step(example_input(t, 0, n_neurons)))
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sharded_counts = sharded.run(n_ticks)
+    sharded_time = time.perf_counter() - start
+
+    #the results must match exactly
+    assert np.array_equal(reference_counts, sharded_counts)
+    for name in NeuronPopulation.state_names:
+        assert np.array_equal(getattr(reference.population, name),
+            getattr(sharded.population, name))
+
+    #stepping with input from this process must match too
+    external = np.full(n_neurons, 2.5)
+    assert np.array_equal(reference.step(external), sharded.step(external))
+
+    print(f"{sharded.n_workers} workers match one process over {n_ticks} ticks")
+    print(f"one process: {n_ticks/reference_time:.1f} ticks/sec, "
+        f"sharded: {n_ticks/sharded_time:.1f} ticks/sec")
+
+    sharded.close()
+
+    #an event driven network sharded part way through a run must carry on exactly as a dense
+    #one, so neurons it skipped must be caught up first
+    dense = Network.random(10_000, 10, 0, 6, seed=0)
+    event_driven = Network.random(10_000, 10, 0, 6, seed=0, event_driven=True)
+    for t in range(100):
+        #drive it for a while then leave it be, so neurons fall dormant and are skipped
+        external = example_input(t, 0, 10_000) if t < 50 else None
+        dense.step(external)
+        event_driven.step(external)
+
+    with ShardedNetwork(event_driven, 2, example_input) as sharded:
+        for t in range(100, 150):
+            external = example_input(t, 0, 10_000)
+            assert np.array_equal(dense.step(external), sharded.step(external)), f"tick {t}"
+    print("event driven network matches dense after sharding")
+
+    #a worker failing must stop the others and the run with its error, not hang them, and
+    #free the shared memory
+    def failing_input(tick, lo, hi):
+        if tick == 5 and lo > 0:
+            raise ValueError("no input for this tick")
+        return example_input(tick, lo, hi)
+
+    with ShardedNetwork(Network.random(1000, 10, 0, 6, seed=0), 2, failing_input) as failing:
+        try:
+            failing.run(10)
+            assert False, "a failing worker should fail the run"
+        except RuntimeError as e:
+            print(f"expected error: {str(e).splitlines()[-1]}")
+        assert failing.blocks is None
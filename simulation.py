@@ -1,13 +1,25 @@
+import copy
+import logging
 import pathlib
 import json
 import threading
 import time
 
+import numpy as np
+
+import checkpoint
+import logs
+from archive import Archive
+from profiling import PhaseTimer, format_summary
+
 class Simulation:
     #methods to be overriden by child classes
 
     #sets up the variables used for basic functionality
     def __init__(self, path, **kwargs):
+        #lifecycle flags. only changed while holding sim_condition, which is notified on every
+        #change, so either thread can wait for the other without polling
+        self.sim_condition = threading.Condition()
         self.sim_running = True
         self.sim_paused = False
         self.sim_thread = None
@@ -15,29 +27,319 @@ class Simulation:
         self.sim_stopped = True
         self.path = path
         self.manifest = kwargs
+
+        #named numpy arrays saved in binary alongside the manifest. child classes put their
+        #neuron state and connectivity here. loaded memory mapped, so opening even a huge
+        #simulation is near instant
+        self.state = checkpoint.read(path, kwargs.get("Checkpoint"))
+
+        #the simulation's genomes and their networks, each only opened when first used (see
+        #archive.Archive), so loading doesn't depend on how many there are
+        self.archive = None
+        if path is not None:
+            self.archive = Archive(path, kwargs.get("Genomes Directory", "Genomes"),
+                kwargs.get("Networks Directory", "Networks"))
+
+        #tick pacing (see step_loop). tick_rate is the target number of ticks per second, or
+        #None to run as fast as possible, and can be changed while the simulation runs
+        self.tick_rate = None
+        #the most ticks run back to back to catch up after falling behind. if the simulation
+        #falls further behind than this, the backlog is dropped rather than caught up
+        self.max_batch = 50
+        #measured by step_loop: ticks per second actually achieved, how far behind schedule
+        #the simulation is in seconds, and the number of ticks dropped from the backlog
+        self.achieved_rate = 0.0
+        self.lag = 0.0
+        self.dropped_ticks = 0
+
+        #per-phase tick timings (see profiling.PhaseTimer). step_loop times each tick, and
+        #the step function can mark its own phases in between. switched off by default; set
+        #timings.enabled to switch it on at any time. while it's on, a summary is logged every
+        #timings.summary_interval seconds
+        self.timings = PhaseTimer()
+
+        #background saving (see save_async)
+        self.save_requested = False
+        self.save_thread = None
+        self.save_lock = threading.Lock()
+        #guards self.manifest against being changed by a save while it's being copied
+        self.manifest_lock = threading.Lock()
+        #the exception of a background save that failed and hasn't been raised by
+        #wait_for_save yet, and the message of the last failure and how many there have been,
+        #for metrics
+        self.save_failure = None
+        self.last_save_error = None
+        self.failed_saves = 0
     
     #configures a newly created simulation
     @staticmethod
     def configure_new_sim(path):
         pass
 
-    #the target function for the simulation thread
+    #the target function for the simulation thread. usually sets up, calls step_loop and
+    #cleans up
     def sim_thread_target(self):
         pass
 
+    #updates self.manifest and self.state from the simulation before it is saved. for
+    #save_async, this is called on the simulation thread between ticks
+    def sync_state(self):
+        pass
+
+    #returns a dict of live metrics, i.e. for status requests (see control.py). called from
+    #other threads, so it should only read values the simulation thread sets, never wait on
+    #it. the spike counts are those step reports to self.timings (see
+    #PhaseTimer.count_spikes), so stay at 0 for simulations that don't. child classes add
+    #their own, i.e. the tick
+    def metrics(self):
+        return {
+            "achieved_rate" : self.achieved_rate,
+            "lag" : self.lag,
+            "dropped_ticks" : self.dropped_ticks,
+            "failed_saves" : self.failed_saves,
+            "last_save_error" : self.last_save_error,
+            "spikes" : self.timings.total_spikes,
+            "spikes_per_tick" : self.timings.tick_spikes,
+            "firing_rate" : self.firing_rate()
+        }
+
+    #returns the fraction of neurons that spiked on the latest tick, from the spikes counted
+    #by step (see PhaseTimer.count_spikes)
+    def firing_rate(self):
+        timings = self.timings
+        return timings.tick_spikes / timings.tick_neurons if timings.tick_neurons else 0.0
+
 
     #parent methods that usually will not be overridden
 
-    #saves the current state of the simulation to self.path
+    #runs step once per tick on the simulation thread until the simulation is stopped,
+    #waiting without polling while it is paused. called by sim_thread_target. if tick_rate is
+    #set, ticks are paced to it against wall-clock time. the schedule is kept from a fixed
+    #start, so timing errors don't accumulate into drift, and when behind, every tick that is
+    #due runs in one batch
+    def step_loop(self, step):
+        try:
+            self.reset_pacing()
+            while self.wait_until_unpaused():
+                #tick_rate can be changed from other threads at any time, so each batch reads
+                #it once and keeps to that
+                tick_rate = self.tick_rate
+                n_ticks = 0
+                for _ in range(self.ticks_due(tick_rate)):
+                    self.timings.start_tick()
+                    step()
+                    self.timings.mark("other")
+                    self.end_tick()
+                    self.timings.end_tick("save")
+                    n_ticks += 1
+
+                    #don't hold up a pause or stop for the rest of the batch
+                    if self.sim_paused or not self.sim_running:
+                        break
+
+                self.update_pacing(n_ticks, tick_rate)
+                if self.timings.summary_due():
+                    Simulation.log(format_summary(self.timings.summary()))
+        finally:
+            with self.sim_condition:
+                self.sim_active = False
+                self.sim_stopped = True
+                self.sim_condition.notify_all()
+
+    #blocks the simulation thread while the simulation is paused
+    #returns false if the simulation has been ordered to stop, otherwise true
+    def wait_until_unpaused(self):
+        with self.sim_condition:
+            if self.sim_paused and self.sim_running:
+                #serve a snapshot requested during the last tick before going idle
+                self.end_tick()
+                self.sim_active = False
+                self.sim_condition.notify_all()
+                self.sim_condition.wait_for(lambda: not self.sim_paused or not self.sim_running)
+
+                #time spent paused isn't owed to the schedule
+                self.reset_pacing()
+
+            if not self.sim_running:
+                return False
+
+            if not self.sim_active:
+                self.sim_active = True
+                self.sim_condition.notify_all()
+
+        return True
+
+    #starts the tick schedule and the achieved rate measurement from now
+    def reset_pacing(self):
+        self.next_tick_time = time.perf_counter()
+        self.rate_window_start = self.next_tick_time
+        self.rate_window_ticks = 0
+
+    #waits until the next tick is due, and returns how many ticks to run now. returns 0 if
+    #the wait was interrupted by a pause or stop
+    #tick_rate: the tick rate of this batch, or None if unpaced
+    def ticks_due(self, tick_rate):
+        if not tick_rate:
+            return 1
+
+        now = time.perf_counter()
+        if now < self.next_tick_time:
+            #wait on the condition, so pausing or stopping interrupts the wait
+            with self.sim_condition:
+                self.sim_condition.wait_for(lambda: self.sim_paused or not self.sim_running,
+                    timeout=self.next_tick_time - now)
+
+            now = time.perf_counter()
+            if now < self.next_tick_time:
+                return 0
+
+        due = int((now - self.next_tick_time) * tick_rate) + 1
+        if due > self.max_batch:
+            #too far behind to catch up. drop the backlog and carry on from now
+            self.dropped_ticks += due - self.max_batch
+            self.next_tick_time = now - (self.max_batch - 1) / tick_rate
+            due = self.max_batch
+
+        return due
+
+    #advances the tick schedule by n_ticks run at tick_rate and updates achieved_rate and lag
+    def update_pacing(self, n_ticks, tick_rate):
+        now = time.perf_counter()
+        if tick_rate:
+            self.next_tick_time += n_ticks / tick_rate
+            self.lag = max(now - self.next_tick_time, 0)
+        else:
+            #keep the schedule at now while unpaced, so setting a rate later starts from then
+            #instead of owing every tick since pacing was reset
+            self.next_tick_time = now
+            self.lag = 0.0
+
+        #the achieved rate is measured over windows of about a second
+        self.rate_window_ticks += n_ticks
+        elapsed = now - self.rate_window_start
+        if elapsed >= 1:
+            self.achieved_rate = self.rate_window_ticks / elapsed
+            self.rate_window_start = now
+            self.rate_window_ticks = 0
+
+    #saves the current state of the simulation to self.path, blocking until it is written.
+    #the simulation should be stopped or paused; use save_async while it is running
     def save(self):
-        with open(self.path + "/manifest.json", "w", encoding="utf-8") as f:
-            json.dump(self.manifest, f)
+        try:
+            self.wait_for_save()
+        except Exception:
+            #an earlier background save failed. it's already logged and counted in metrics,
+            #and this save replaces it
+            pass
+
+        self.sync_state()
+        self.write_save(copy.deepcopy(self.manifest), self.state)
+
+    #saves the current state of the simulation to self.path without stopping it. the
+    #simulation thread takes a snapshot at the next tick boundary (see end_tick), which a
+    #background thread then writes while the simulation carries on
+    def save_async(self):
+        with self.sim_condition:
+            if self.sim_active:
+                self.save_requested = True
+                return
+
+            #no ticks are running, so the state can be snapshotted from this thread
+            self.start_save(*self.snapshot())
+
+    #called by the simulation thread between ticks. takes any requested snapshot
+    def end_tick(self):
+        if self.save_requested:
+            self.save_requested = False
+            self.start_save(*self.snapshot())
+
+            #wake anything waiting for the snapshot (see wait_for_save)
+            with self.sim_condition:
+                self.sim_condition.notify_all()
+
+    #returns a copy of the manifest and state that the simulation can carry on changing
+    #without affecting. read-only arrays can't change, so they are used without copying
+    def snapshot(self):
+        self.sync_state()
+
+        state = {}
+        for name, values in self.state.items():
+            values = np.asarray(values)
+            state[name] = values.copy() if values.flags.writeable else values
+
+        with self.manifest_lock:
+            return copy.deepcopy(self.manifest), state
+
+    #writes a snapshot on a background thread. saves are written in the order they were
+    #started
+    def start_save(self, manifest, state):
+        previous_save = self.save_thread
+
+        def write():
+            if previous_save is not None:
+                previous_save.join()
+
+            #a failed save leaves the previous one intact. keep the error for wait_for_save
+            #and metrics, rather than losing it with the thread
+            try:
+                self.write_save(manifest, state)
+            except Exception as e:
+                self.save_failure = e
+                self.last_save_error = f"{type(e).__name__}: {e}"
+                self.failed_saves += 1
+                Simulation.log(f"Saving failed: {self.last_save_error}", logging.ERROR)
+
+        #only publish the thread once it has started, so it can always be joined
+        save_thread = threading.Thread(target=write)
+        save_thread.start()
+        self.save_thread = save_thread
+
+    #blocks until any snapshot requested by save_async has been taken and every background
+    #save has finished
+    #raises the exception of a background save that failed since the last call, if any
+    def wait_for_save(self):
+        with self.sim_condition:
+            self.sim_condition.wait_for(lambda: not self.save_requested or not self.sim_active)
+        if self.save_thread is not None:
+            self.save_thread.join()
+
+        error, self.save_failure = self.save_failure, None
+        if error is not None:
+            raise error
+
+    #writes a manifest and state to self.path. the arrays are written to a new checkpoint
+    #first (skipping any unchanged since the last one), then the manifest pointing to it is
+    #replaced atomically, so a crash mid-save leaves the previous save intact
+    def write_save(self, manifest, state):
+        with self.save_lock:
+            if state:
+                previous = self.manifest.get("Checkpoint")
+                generation = 0 if previous is None else previous["Generation"] + 1
+                manifest["Checkpoint"] = checkpoint.write(self.path, state, generation, previous)
+
+            checkpoint.write_json(self.path, "manifest.json", manifest)
+
+            #the next save builds on this checkpoint now that the manifest points to it. the
+            #simulation thread may be copying the manifest (see snapshot)
+            if state:
+                with self.manifest_lock:
+                    self.manifest["Checkpoint"] = manifest["Checkpoint"]
+
+            #the old checkpoint is no longer needed once the new manifest is in place
+            checkpoint.prune(self.path, manifest.get("Checkpoint"))
 
     #creates the simulation thread
     def start(self):
         #ensure that all variables are as they should be
-        self.sim_running = True
-        self.sim_paused = False
+        with self.sim_condition:
+            self.sim_running = True
+            self.sim_paused = False
+            self.sim_active = False
+            self.sim_stopped = False
+
+        #log to the simulation's own files too while it runs
+        if self.path is not None:
+            logs.log_to_directory(self.path + "/Logs")
 
         #create and start the thread
         self.sim_thread = threading.Thread(target=self.sim_thread_target)
@@ -45,24 +347,36 @@ class Simulation:
 
     #orders the simulation thread to stop and blocks until it does so
     def stop(self):
-        self.sim_running = False
-        while not self.sim_stopped:
-            time.sleep(0.1)
+        with self.sim_condition:
+            self.sim_running = False
+            self.sim_condition.notify_all()
+
+        if not self.sim_thread is None:
+            self.sim_thread.join()
         
         self.sim_thread = None
         self.sim_active = False
+        self.sim_stopped = True
+
+        #serve a snapshot requested after the last tick boundary
+        self.end_tick()
+
+        if self.path is not None:
+            logs.stop_logging_to_directory(self.path + "/Logs")
 
     #orders the simulation thread to pause and blocks until it does so
     def pause(self):
-        self.sim_paused = True
-        while self.sim_active:
-            time.sleep(0.1)
+        with self.sim_condition:
+            self.sim_paused = True
+            self.sim_condition.notify_all()
+            self.sim_condition.wait_for(lambda: not self.sim_active or self.sim_stopped)
 
     #orders the simulation thread to unpause and blocks until it does so
     def unpause(self):
-        self.sim_paused = False
-        while not self.sim_active:
-            time.sleep(0.1)
+        with self.sim_condition:
+            self.sim_paused = False
+            self.sim_condition.notify_all()
+            self.sim_condition.wait_for(lambda: self.sim_active or self.sim_stopped)
 
     #returns true if the simulation has a thread
     def has_started(self):
@@ -92,30 +406,52 @@ class Simulation:
             manifest = json.load(f)
             return cls(path, **manifest)
 
-    #TODO add configurable logging capabilities to this
+    #logs a message. the message is only queued, and written to the console and the log files
+    #of running simulations by a background thread, so this never blocks (see logs.py)
+    #level: the logging level of the message, i.e. logging.WARNING
+    #key: optional key to rate limit the message by. of the messages sharing a key, only
+    #about one a second is logged, i.e. for a message logged every tick
     @staticmethod
-    def log(msg):
-        print(f"\u001b[36m<<<SIMULATION THREAD>>>\u001b[0m {msg}")
+    def log(msg, level=logging.INFO, key=None):
+        if not logs.logger.handlers:
+            logs.start()
+
+        logs.logger.log(level, msg, extra={"key" : key})
 
 if __name__ == "__main__":
     #console colours
     import os
     os.system("")
 
+    import numpy as np
+
+    from network import Network
+
     class TestSim(Simulation):
         def __init__(self, path, **kwargs):
             Simulation.__init__(self, path, **kwargs)
 
             self.tick = self.manifest["Simulation update"]
 
+            #resume the network from the checkpoint, or build a new one from the genome. the
+            #compiled network is cached, so this is only slow the first time
+            if self.state:
+                self.network = Network.from_arrays(self.state)
+            else:
+                self.network = self.archive.network("example")
+            self.rng = np.random.default_rng()
+
+            #summarise where tick time goes every second rather than logging every tick
+            self.network.timer = self.timings
+            self.timings.enabled = True
+            self.timings.summary_interval = 1
+
             print(kwargs, sep="\n")
 
-        def save(self):
-            #update the manifest
+        def sync_state(self):
+            #update the manifest and the network's arrays
             self.manifest["Simulation update"] = self.tick
-
-            #call the parent class' save method to save the manifest
-            Simulation.save(self)
+            self.state = self.network.arrays()
 
         @staticmethod
         def configure_new_sim(path):
@@ -123,8 +459,6 @@ if __name__ == "__main__":
             manifest = {
                 "Genomes Directory" : "Genomes",
                 "Networks Directory" : "Networks",
-                "Genomes" : [],
-                "Networks" : [],
                 "Simulation update" : 0
             }
             with open(path + "/manifest.json", "w", encoding="utf-8") as f:
@@ -134,30 +468,37 @@ if __name__ == "__main__":
             pathlib.Path(path + "/Genomes").mkdir()
             pathlib.Path(path + "/Networks").mkdir()
 
+            #a single randomly connected group of neurons
+            genome = {
+                "Neurons" : [{"Count" : 100_000}],
+                "Connections" : [
+                    {"From" : 0, "To" : 0, "Fan out" : 10, "Weight low" : 0, "Weight high" : 6}
+                ],
+                "Seed" : 0
+            }
+            with open(path + "/Genomes/example.json", "w", encoding="utf-8") as f:
+                json.dump(genome, f)
+
+        #performs one simulation tick
+        def do_tick(self):
+            #each simulation tick goes here
+            external = 4 * self.rng.random(len(self.network))
+            self.timings.mark("input")
+
+            spikes = self.network.step(external)
+            self.timings.count_spikes(len(spikes), len(self.network))
+            self.tick += 1
+
         #thread target for the simulation thread
         def sim_thread_target(self):
-            self.sim_stopped = False
-
             #simulation setup goes here
             Simulation.log("Initialising simulation...")
 
-            #update loop
-            while self.sim_running:
-                self.sim_active = True
-                
-                #each simulation tick goes here
-                time.sleep(0.25)
-                self.tick += 1
-                Simulation.log(f"Tick {self.tick}: Doing cool simulation stuff... ")
-
-                #wait until the simulation is unpaused before doing the next tick
-                while self.sim_paused and self.sim_running:
-                    self.sim_active = False
-                    time.sleep(0.1)
+            #update loop. runs do_tick until the simulation is stopped, waiting while paused
+            self.step_loop(self.do_tick)
 
             #simulation cleanup goes here
             Simulation.log("Simulation closing...")
-            self.sim_stopped = True
                 
 
     #create and load a sim
@@ -167,9 +508,16 @@ if __name__ == "__main__":
         print("Simulation already exists, continue as normal")
 
     sim = TestSim.load_sim("Simulations/TestSim")
+    sim.tick_rate = 4
 
-    #start it, run for 5s, stop it, save it
+    #start it, save it while it runs, then after 5s stop it and save it
     sim.start()
-    time.sleep(5)
+    time.sleep(2.5)
+    sim.save_async()
+    time.sleep(2.5)
     sim.stop()
     sim.save()
+
+    metrics = sim.metrics()
+    assert metrics["spikes"] > 0
+    print(f"{metrics['spikes']} spikes, {metrics['firing_rate']:.2%} firing on the last tick")
@@ -0,0 +1,261 @@
+import numpy as np
+
+#a set of weighted connections from n_pre presynaptic neurons to n_post postsynaptic neurons.
+#stored in compressed sparse row form keyed by the presynaptic neuron (i.e. CSC form of the
+#post x pre weight matrix), so the outgoing synapses of a neuron are one contiguous slice:
+#   targets[indptr[i]:indptr[i+1]] and weights[indptr[i]:indptr[i+1]]
+#there are no per-connection python objects, so this scales to millions of synapses
+#synapses can also have delays (see DelayQueue): the number of ticks a spike takes to reach
+#each target, stored in the same order as the targets
+class Synapses:
+    #sets up the synapses from already compressed arrays
+    #dtype: the type to store the weights as. defaults to the type of weights if it's a float
+    #type, otherwise float64. float32 halves the memory the weights use
+    #delays: optional array of each synapse's delay in ticks, at least 1. a delay of 1 is the
+    #same as no delay: a spike on one tick is input on the next
+    def __init__(self, n_pre, n_post, indptr, targets, weights, dtype=None, delays=None):
+        if dtype is None:
+            weights = np.asarray(weights)
+            dtype = weights.dtype if weights.dtype.kind == "f" else np.float64
+
+        self.n_pre = n_pre
+        self.n_post = n_post
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.targets = np.ascontiguousarray(targets, dtype=np.int32)
+        self.weights = np.ascontiguousarray(weights, dtype=dtype)
+
+        #the structure of the synapses never changes once built, and the weights only change
+        #under plasticity, which takes its own writeable copy (see plasticity.STDP). marking
+        #them read-only lets snapshots (see Simulation.save_async) use them without copying,
+        #and checkpoints reuse their hashes (see checkpoint.array_hash)
+        self.indptr.flags.writeable = False
+        self.targets.flags.writeable = False
+        self.weights.flags.writeable = False
+
+        if len(self.indptr) != n_pre + 1:
+            raise ValueError(f"indptr must have {n_pre + 1} entries, got {len(self.indptr)}")
+        if len(self.targets) != len(self.weights) or len(self.targets) != self.indptr[-1]:
+            raise ValueError("targets and weights must both have indptr[-1] entries")
+
+        self.delays = None
+        self.max_delay = 1
+        if delays is not None:
+            delays = np.asarray(delays)
+            if len(delays) != len(self.targets):
+                raise ValueError("delays must have an entry for every synapse")
+            if len(delays) > 0 and delays.min() < 1:
+                raise ValueError("delays must be at least 1 tick")
+
+            #like param_index, the smallest type that fits keeps delays to a byte or two each
+            self.max_delay = int(delays.max()) if len(delays) > 0 else 1
+            self.delays = np.ascontiguousarray(delays,
+                dtype=np.min_scalar_type(self.max_delay))
+            self.delays.flags.writeable = False
+
+        #the index of the synapses by postsynaptic neuron (see incoming). only built when
+        #first needed, since only plasticity uses it
+        self.incoming_indptr = None
+        self.incoming_synapses = None
+        self.incoming_sources = None
+
+    #builds synapses from parallel arrays of presynaptic ids, postsynaptic ids and weights
+    #delays: optional parallel array of delays
+    @classmethod
+    def from_edges(cls, n_pre, n_post, pre, post, weights, delays=None):
+        pre = np.asarray(pre)
+
+        #a stable sort keeps each neuron's synapses in the order they were given
+        order = np.argsort(pre, kind="stable")
+        indptr = np.zeros(n_pre + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pre, minlength=n_pre), out=indptr[1:])
+
+        if delays is not None:
+            delays = np.asarray(delays)[order]
+        return cls(n_pre, n_post, indptr, np.asarray(post)[order], np.asarray(weights)[order],
+            delays=delays)
+
+    #builds synapses where every presynaptic neuron connects to fan_out random targets, with
+    #weights drawn uniformly from [weight_low, weight_high)
+    #dtype: the type to store the weights as. the same seed gives the same synapses whatever
+    #the type, rounded to it
+    #max_delay: if more than 1, each synapse gets a random delay from 1 to max_delay ticks.
+    #the targets and weights are the same as without delays
+    @classmethod
+    def random(cls, n_pre, n_post, fan_out, weight_low, weight_high, seed=None,
+            dtype=np.float64, max_delay=1):
+        rng = np.random.default_rng(seed)
+        n_synapses = n_pre * fan_out
+
+        indptr = np.arange(0, n_synapses + 1, fan_out, dtype=np.int64)
+        targets = rng.integers(0, n_post, n_synapses, dtype=np.int32)
+        weights = rng.uniform(weight_low, weight_high, n_synapses)
+        delays = None if max_delay <= 1 else rng.integers(1, max_delay + 1, n_synapses)
+
+        return cls(n_pre, n_post, indptr, targets, weights, dtype, delays)
+
+    #returns the synapses onto postsynaptic neurons lo to hi (exclusive) only, renumbered so
+    #that neuron lo is target 0. the synapses keep their relative order, so the swi computed
+    #for those neurons is identical
+    def target_range(self, lo, hi):
+        keep = (self.targets >= lo) & (self.targets < hi)
+        pre = np.repeat(np.arange(self.n_pre), np.diff(self.indptr))
+
+        indptr = np.zeros(self.n_pre + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pre[keep], minlength=self.n_pre), out=indptr[1:])
+
+        return Synapses(self.n_pre, hi - lo, indptr, self.targets[keep] - lo, self.weights[keep],
+            delays=None if self.delays is None else self.delays[keep])
+
+    #returns the indices of every synapse leaving the presynaptic neurons in active
+    #active: array of presynaptic neuron indices
+    def outgoing(self, active):
+        return _slices(self.indptr, active)
+
+    #returns the indices of every synapse arriving at the postsynaptic neurons in active,
+    #along with each synapse's presynaptic neuron
+    #active: array of postsynaptic neuron indices
+    #returns (synapses, sources)
+    def incoming(self, active):
+        if self.incoming_indptr is None:
+            self.build_incoming()
+
+        positions = _slices(self.incoming_indptr, active)
+        return self.incoming_synapses[positions], self.incoming_sources[positions]
+
+    #builds the index used by incoming: the synapses sorted by postsynaptic neuron (i.e. the
+    #csr form of the post x pre weight matrix), with their presynaptic neurons. this costs
+    #two int arrays the length of the synapses
+    def build_incoming(self):
+        sources = np.repeat(np.arange(self.n_pre, dtype=np.int32), np.diff(self.indptr))
+        order = np.argsort(self.targets, kind="stable")
+
+        indptr = np.zeros(self.n_post + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.targets, minlength=self.n_post), out=indptr[1:])
+
+        self.incoming_synapses = order
+        self.incoming_sources = sources[order]
+        self.incoming_indptr = indptr
+
+    #returns the sum of weighted inputs for every postsynaptic neuron from the previous tick's
+    #output spikes. only the synapses of neurons that spiked are visited, so the cost is
+    #proportional to the number of spikes rather than the number of synapses. the sums are
+    #always float64, whatever the type of the weights
+    #spikes: boolean spike vector (i.e. NeuronPopulation.output()) or array of spiking indices
+    def compute_swi(self, spikes):
+        spikes = np.asarray(spikes)
+        active = np.flatnonzero(spikes) if spikes.dtype == bool else spikes
+
+        synapses = self.outgoing(active)
+
+        #bincount returns integers when there is nothing to sum
+        if len(synapses) == 0:
+            return np.zeros(self.n_post)
+        return np.bincount(self.targets[synapses], self.weights[synapses], minlength=self.n_post)
+
+    #sparse version of compute_swi for event driven propagation. only the neurons that spiked
+    #push their contributions, and only the targets that received any are returned
+    #active: array of spiking presynaptic neuron indices
+    #returns (targets, swi): sorted unique target indices and the sum of their weighted inputs
+    def propagate(self, active):
+        synapses = self.outgoing(active)
+        targets, inverse = np.unique(self.targets[synapses], return_inverse=True)
+
+        #sums in synapse order, exactly as compute_swi does
+        return targets, np.bincount(inverse, self.weights[synapses], minlength=len(targets))
+
+    #returns the number of synapses
+    def __len__(self):
+        return len(self.targets)
+
+#returns the concatenated ranges [indptr[i], indptr[i+1]) of every i in active, without a
+#python loop
+def _slices(indptr, active):
+    starts = indptr[active]
+    counts = indptr[active + 1] - starts
+    total = int(counts.sum())
+
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(total)
+
+#input in flight along delayed synapses. a ring buffer holds the pending swi of every
+#postsynaptic neuron for each of the next max_delay ticks, so memory is max_delay * n_post
+#however many spikes are in flight. each tick, the synapses of the neurons that spiked add
+#their weights into the buckets their delays lead to, all at once, and the bucket due now
+#is taken out as that tick's swi
+class DelayQueue:
+    #synapses: the Synapses to deliver input along
+    #pending: optional existing ring buffer to carry on from, i.e. from a checkpoint. it may
+    #have more buckets than the synapses need
+    def __init__(self, synapses, pending=None):
+        self.synapses = synapses
+        if pending is None:
+            pending = np.zeros((synapses.max_delay, synapses.n_post))
+        elif pending.shape[0] < synapses.max_delay or pending.shape[1] != synapses.n_post:
+            raise ValueError(f"pending must have at least {synapses.max_delay} buckets of "
+                f"{synapses.n_post} entries")
+        self.pending = pending
+
+    #sends the output spikes of the tick before tick along the synapses
+    #active: array of spiking presynaptic neuron indices
+    def push(self, tick, active):
+        synapses = self.synapses.outgoing(active)
+        if len(synapses) == 0:
+            return
+
+        #a delay of 1 is due on tick itself. the weights are added in synapse order, so with
+        #every delay 1 the sums are identical to compute_swi. (the tick is made an int64
+        #first, so the small delay type can't overflow)
+        bucket = (np.int64(tick - 1) + self.synapses.delays[synapses]) % len(self.pending)
+        np.add.at(self.pending, (bucket, self.synapses.targets[synapses]),
+            self.synapses.weights[synapses])
+
+    #returns the swi due on tick, and empties its bucket for reuse
+    def pop(self, tick):
+        bucket = self.pending[tick % len(self.pending)]
+        swi = bucket.copy()
+        bucket[:] = 0
+
+        return swi
+
+if __name__ == "__main__":
+    import time
+
+    #test settings
+    n_neurons = 100_000
+    fan_out = 100
+    firing_rate = 0.01
+
+    #check against a plain dense computation on a small network
+    small = Synapses.random(50, 40, 6, -1, 1, seed=0)
+    dense = np.zeros((small.n_post, small.n_pre))
+    for i in range(small.n_pre):
+        for j in range(small.indptr[i], small.indptr[i + 1]):
+            dense[small.targets[j], i] += small.weights[j]
+
+    spikes = np.random.default_rng(1).random(small.n_pre) < 0.3
+    assert np.allclose(small.compute_swi(spikes), dense @ spikes)
+    assert np.allclose(small.compute_swi(np.flatnonzero(spikes)), dense @ spikes)
+
+    #from_edges must rebuild the same synapses from an unordered edge list
+    pre = np.repeat(np.arange(small.n_pre), np.diff(small.indptr))
+    shuffle = np.random.default_rng(2).permutation(len(small))
+    rebuilt = Synapses.from_edges(small.n_pre, small.n_post, pre[shuffle],
+        small.targets[shuffle], small.weights[shuffle])
+    assert np.allclose(rebuilt.compute_swi(spikes), dense @ spikes)
+
+    #incoming must find exactly the synapses onto each neuron, with their sources
+    posts = np.array([3, 7, 0, 39])
+    incoming, sources = small.incoming(posts)
+    expected = np.flatnonzero(np.isin(small.targets, posts))
+    assert np.array_equal(np.sort(incoming), expected)
+    assert np.array_equal(sources, pre[incoming])
+    print("compute_swi matches dense matrix product, incoming matches targets")
+
+    #time a large network
+    synapses = Synapses.random(n_neurons, n_neurons, fan_out, 0, 1, seed=0)
+    spikes = np.random.default_rng(3).random(n_neurons) < firing_rate
+
+    start = time.perf_counter()
+    synapses.compute_swi(spikes)
+    elapsed = time.perf_counter() - start
+    print(f"{len(synapses)} synapses, {firing_rate:.0%} firing: {elapsed*1e3:.3f}ms per tick")